@@ -1,12 +1,11 @@
 import os
 import logging
 from flask import Flask
+from jinja2 import FileSystemBytecodeCache
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
 
 class Base(DeclarativeBase):
     pass
@@ -14,28 +13,120 @@ class Base(DeclarativeBase):
 
 db = SQLAlchemy(model_class=Base)
 
-# Create the app, specifying 'Admin' as the template folder
-app = Flask(__name__, template_folder="Admin")
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
-# Configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///company_management.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+def default_config():
+    """Settings read from the environment when the app is created"""
+    return {
+        "SECRET_KEY": os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production"),
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "INFO"),
 
-# Initialize the app with the extension
-db.init_app(app)
+        # Configure the database
+        "SQLALCHEMY_DATABASE_URI": os.environ.get("DATABASE_URL", "sqlite:///company_management.db"),
+
+        # SQLite production profile (see database.py); ignored for other databases
+        "SQLITE_JOURNAL_MODE": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+        "SQLITE_SYNCHRONOUS": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "SQLITE_CACHE_SIZE_KB": int(os.environ.get("SQLITE_CACHE_SIZE_KB", 65536)),
+        "SQLITE_MMAP_SIZE": int(os.environ.get("SQLITE_MMAP_SIZE", 268435456)),
+        "SQLITE_BUSY_TIMEOUT_MS": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+
+        # Writes that still hit "database is locked" are retried with backoff
+        "DB_WRITE_RETRIES": int(os.environ.get("DB_WRITE_RETRIES", 5)),
+        "DB_RETRY_BASE_DELAY": float(os.environ.get("DB_RETRY_BASE_DELAY", 0.05)),
+
+        # Request threads per worker; the connection pool is sized from this and JOB_WORKERS
+        "WEB_THREADS": int(os.environ.get("WEB_THREADS", 4)),
+
+        # Configure the metrics cache (see cache.py for the supported backends)
+        "METRICS_CACHE_URL": os.environ.get("METRICS_CACHE_URL", "memory://"),
+        "METRICS_CACHE_TTL": int(os.environ.get("METRICS_CACHE_TTL", 3600)),
+
+        # Rows written per INSERT when importing CSV files
+        "IMPORT_CHUNK_SIZE": int(os.environ.get("IMPORT_CHUNK_SIZE", 5000)),
+
+        # Reports longer than REPORT_ASYNC_WEEKS are built by a background job
+        "REPORT_ASYNC_WEEKS": int(os.environ.get("REPORT_ASYNC_WEEKS", 26)),
+        "REPORT_MAX_WEEKS": int(os.environ.get("REPORT_MAX_WEEKS", 520)),
+        "JOB_WORKERS": int(os.environ.get("JOB_WORKERS", 2)),
+        "JOB_RESULT_TTL": int(os.environ.get("JOB_RESULT_TTL", 3600)),
+
+        # Accounts and expenses older than this many weeks move to the archive tables
+        "ARCHIVE_AFTER_WEEKS": int(os.environ.get("ARCHIVE_AFTER_WEEKS", 52)),
+        "ARCHIVE_BATCH_SIZE": int(os.environ.get("ARCHIVE_BATCH_SIZE", 5000)),
+
+        # Change feed entries older than this are removed by flask prune-change-log
+        "CHANGE_LOG_RETENTION_DAYS": int(os.environ.get("CHANGE_LOG_RETENTION_DAYS", 30)),
+
+        # Live dashboard stream: keepalive interval, reconnect age and connections per worker
+        "STREAM_HEARTBEAT": int(os.environ.get("STREAM_HEARTBEAT", 15)),
+        "STREAM_MAX_AGE": int(os.environ.get("STREAM_MAX_AGE", 300)),
+        "STREAM_MAX_CLIENTS": int(os.environ.get("STREAM_MAX_CLIENTS", 50)),
+
+        # Compiled templates are kept here across restarts (default: instance/jinja-cache)
+        "TEMPLATE_CACHE_DIR": os.environ.get("TEMPLATE_CACHE_DIR"),
+
+        # Per-request SQL/latency metrics on /metrics; statements slower than this are logged
+        "INSTRUMENTATION_ENABLED": os.environ.get("INSTRUMENTATION_ENABLED", "1") != "0",
+        "SLOW_QUERY_MS": float(os.environ.get("SLOW_QUERY_MS", 200)),
+    }
+
+
+def configure_logging(level):
+    """Set the root log level, adding a stderr handler if nothing else has"""
+    logging.basicConfig(level=level)
+    logging.getLogger().setLevel(level)
+
+
+def create_app(config=None):
+    """Build an app from the environment, overridden by the config mapping.
+
+    Nothing here touches the database; create or upgrade the schema with
+    ``flask init-db``.
+    """
+    # Create the app, specifying 'Admin' as the template folder
+    app = Flask(__name__, template_folder="Admin")
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+
+    app.config.update(default_config())
+    app.config.update(config or {})
+    configure_logging(app.config["LOG_LEVEL"])
+
+    # Workers load compiled template bytecode instead of recompiling every template
+    template_cache_dir = app.config["TEMPLATE_CACHE_DIR"] or os.path.join(app.instance_path, "jinja-cache")
+    os.makedirs(template_cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(template_cache_dir)
+
+    import database
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", database.engine_options(app.config))
+
+    # Initialize the app with the extensions
+    db.init_app(app)
+    database.init_app(app)
+
+    import instrumentation
+    instrumentation.init_app(app)
+
+    import assets
+    assets.init_app(app)
+
+    from cache import metrics_cache
+    metrics_cache.init_app(app)
+
+    from jobs import job_runner
+    job_runner.init_app(app)
+
+    from notifier import change_notifier
+    change_notifier.init_app(app)
+
+    from directory import employee_directory
+    employee_directory.init_app(app)
 
-with app.app_context():
     # Import models and routes
     import models
     import routes
-    
-    # Create all tables
-    db.create_all()
+    import commands
+
+    routes.init_app(app)
+    commands.register_commands(app)
 
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    return app
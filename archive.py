@@ -0,0 +1,105 @@
+"""Hot/cold tiering of accounts and expenses.
+
+Almost every page reads the current week or the last few, so rows older than
+ARCHIVE_AFTER_WEEKS are moved out of ``account`` and ``expense`` into
+``archived_account`` and ``archived_expense``, keeping their ids. The live
+tables, their indexes and every COUNT over them stay the size of recent
+history.
+
+Closed weeks are reported from their WeeklyReport rollups, which are rebuilt
+before any of their rows move. Queries that still need raw rows from before
+the watermark in ``archive_state`` (the time-series API, the leaderboard and
+rollup refreshes) read both tables, and the list pages show archived rows
+with ``?archived=1``.
+"""
+from datetime import date, datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, literal
+from app import db
+from cache import metrics_cache
+from database import run_write
+from models import Account, Expense, ArchivedAccount, ArchivedExpense, ArchiveState
+from reporting import week_start_for, rebuild_weekly_reports
+
+# (name, live model, archive model, date column) for every archived table
+TIERS = (
+    ('accounts', Account, ArchivedAccount, 'date_created'),
+    ('expenses', Expense, ArchivedExpense, 'date_incurred'),
+)
+
+
+def archive_horizon(weeks=None, today=None):
+    """Monday of the oldest week kept live; rows dated before it are archived"""
+    if weeks is None:
+        weeks = current_app.config['ARCHIVE_AFTER_WEEKS']
+    return week_start_for(today or date.today()) - timedelta(weeks=weeks)
+
+
+def _raise_watermark(cutoff):
+    state = ArchiveState.query.first()
+    if state is None:
+        db.session.add(ArchiveState(archived_before=cutoff))
+    elif state.archived_before < cutoff:
+        state.archived_before = cutoff
+        state.updated_at = datetime.utcnow()
+
+
+def _move_batch(model, archived_model, column_name, cutoff, batch_size):
+    """Copy up to batch_size rows dated before cutoff to the archive and delete them"""
+    column = getattr(model, column_name)
+    # SQLite hands out max(id) + 1, so the newest row stays live to keep
+    # archived ids from being reused
+    newest = db.session.query(func.max(model.id)).scalar()
+    if newest is None:
+        return 0
+    ids = [row_id for row_id, in db.session.query(model.id).filter(column < cutoff, model.id < newest)
+           .order_by(column, model.id).limit(batch_size)]
+    if not ids:
+        return 0
+
+    table = model.__table__
+    names = [column.name for column in table.columns]
+    db.session.execute(archived_model.__table__.insert().from_select(
+        names + ['archived_at'],
+        db.select(*table.columns, literal(datetime.utcnow())).where(table.c.id.in_(ids))
+    ))
+    db.session.execute(table.delete().where(table.c.id.in_(ids)))
+    return len(ids)
+
+
+def archive_before(cutoff, batch_size=None, progress=None):
+    """Move accounts and expenses dated before cutoff into the archive tables.
+
+    cutoff is rounded down to a Monday so no week is split between the
+    tiers. The rollups of every week being archived are rebuilt and the
+    watermark raised before any row moves, so readers never miss rows while
+    a run is in progress. Each batch is committed separately.
+
+    Returns {'accounts': moved, 'expenses': moved}.
+    """
+    cutoff = week_start_for(cutoff)
+    batch_size = batch_size or current_app.config['ARCHIVE_BATCH_SIZE']
+    moved = {name: 0 for name, _, _, _ in TIERS}
+
+    oldest = [db.session.query(func.min(getattr(model, column_name))).scalar()
+              for _, model, _, column_name in TIERS]
+    oldest = [day for day in oldest if day is not None and day < cutoff]
+    if not oldest:
+        return moved
+
+    rebuild_weekly_reports(min(oldest), cutoff - timedelta(days=1))
+    run_write(_raise_watermark, cutoff)
+
+    for name, model, archived_model, column_name in TIERS:
+        while True:
+            count = run_write(_move_batch, model, archived_model, column_name, cutoff, batch_size)
+            if not count:
+                break
+            moved[name] += count
+            if progress:
+                progress(name, moved[name])
+
+    # Summaries are unchanged, but cached list pages are not
+    if any(moved.values()):
+        metrics_cache.invalidate()
+    return moved
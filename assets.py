@@ -0,0 +1,140 @@
+"""Fingerprinted, precompressed static assets.
+
+``flask build-assets`` copies every file under ``static/`` into
+``static/dist/`` with a content hash in its name, writes a ``.gz`` variant
+(and a ``.br`` one when the ``brotli`` package is installed) and records the
+mapping in ``static/dist/manifest.json``.
+
+Templates link assets with ``asset_url('css/custom.css')``, which resolves
+the hashed name from the manifest. ``/assets/<name>`` serves those files with
+a one-year immutable Cache-Control, sending the brotli or else the gzip
+variant when the client accepts it. Without a manifest, as in development before a
+build, ``asset_url`` falls back to the plain static URL. The manifest is read
+when the app is created, so build before starting (or upgrading) the server.
+"""
+import os
+import gzip
+import json
+import hashlib
+import mimetypes
+from flask import current_app, request, send_file, abort, url_for
+from werkzeug.security import safe_join
+
+BUILD_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Hashed names never change content, so clients may keep them for a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Files smaller than this are not worth a compressed variant
+MIN_COMPRESS_SIZE = 256
+
+# (Accept-Encoding token, file suffix), most preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def build_dir(app):
+    return os.path.join(app.static_folder, BUILD_DIR)
+
+
+def _hashed_name(filename, content):
+    root, ext = os.path.splitext(filename)
+    return f'{root}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def build_assets(app, use_brotli=None):
+    """Fingerprint and precompress every static file and write the manifest.
+
+    use_brotli=None writes .br files only if the brotli package is installed.
+    Files from earlier builds are kept, so pages rendered from the previous
+    manifest keep working during a rollout. Returns the manifest.
+    """
+    brotli = _brotli() if use_brotli is not False else None
+    if use_brotli and brotli is None:
+        raise RuntimeError('Brotli output needs the brotli package')
+
+    static_folder = app.static_folder
+    output = build_dir(app)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        if os.path.abspath(root) == os.path.abspath(static_folder):
+            dirs[:] = [name for name in dirs if name != BUILD_DIR]
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            filename = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                content = f.read()
+
+            hashed = _hashed_name(filename, content)
+            target = os.path.join(output, hashed)
+            _write(target, content)
+            if len(content) >= MIN_COMPRESS_SIZE:
+                # mtime=0 keeps rebuilds of the same file byte-identical
+                _write(target + '.gz', gzip.compress(content, 9, mtime=0))
+                if brotli is not None:
+                    _write(target + '.br', brotli.compress(content, quality=11))
+            manifest[filename] = hashed
+
+    _write(os.path.join(output, MANIFEST_NAME),
+           json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def load_manifest(app):
+    try:
+        with open(os.path.join(build_dir(app), MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def asset_url(filename):
+    """URL of the fingerprinted build of a static file, or its plain static URL"""
+    hashed = current_app.extensions['asset_manifest'].get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('asset', filename=hashed)
+
+
+def serve_asset(filename):
+    """Serve a fingerprinted file, precompressed if the client accepts it"""
+    path = safe_join(build_dir(current_app), filename)
+    if path is None or filename.endswith(MANIFEST_NAME) or not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    for token, suffix in ENCODINGS:
+        if request.accept_encodings[token] and os.path.isfile(path + suffix):
+            path += suffix
+            encoding = token
+            break
+
+    response = send_file(path, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE, conditional=True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    """Load the asset manifest and add asset_url and the /assets route"""
+    app.extensions['asset_manifest'] = load_manifest(app)
+    app.add_template_global(asset_url)
+    app.add_url_rule('/assets/<path:filename>', 'asset', serve_asset)
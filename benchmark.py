@@ -0,0 +1,412 @@
+"""Route benchmark suite.
+
+Drives every dashboard route through the Flask test client against the
+database in DATABASE_URL (create one with ``flask init-db`` and ``flask
+seed``), recording latency percentiles and SQL queries per request, plus the
+SQL and template render time from each response's Server-Timing header, and
+the latency of each route's first request. Results can be saved as a baseline
+and later runs compared against it; any route slower than the baseline by more
+than --threshold, or issuing more queries, is flagged as a regression and the
+script exits with status 1.
+
+    python benchmark.py --iterations 30 --save-baseline
+    python benchmark.py --compare
+
+--concurrency instead runs reader and writer processes against the database
+at once, like gunicorn workers, and reports throughput and lock errors for
+the SQLite production profile and/or the legacy settings it replaced. It
+adds rows, so point DATABASE_URL at a scratch copy:
+
+    python benchmark.py --concurrency --readers 4 --writers 2 --profile both
+
+--search times the first page of account search through the FTS index against
+the LIKE '%term%' scan it replaces:
+
+    python benchmark.py --search --iterations 10
+
+--templates times loading every template from source against loading its
+compiled bytecode from TEMPLATE_CACHE_DIR, which is what a new worker pays:
+
+    python benchmark.py --templates
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from datetime import date
+from sqlalchemy import event
+
+DEFAULT_ROUTES = [
+    '/',
+    '/reports',
+    '/reports?weeks=12',
+    '/accounts',
+    '/accounts?employee_id=1',
+    '/expenses',
+    '/api/dashboard-data',
+    '/api/timeseries?granularity=month&start=2020-01-01',
+]
+
+DEFAULT_BASELINE = os.path.join('instance', 'bench_baseline.json')
+
+# Routes the concurrency readers alternate between
+CONCURRENCY_READ_ROUTES = ['/', '/accounts', '/api/dashboard-data']
+
+# Account searches for --search: a surname, a full name, an email fragment,
+# an account number prefix and a word with no matches
+SEARCH_QUERIES = ['kamau', 'grace kamau', 'client12345', 'acc00012', 'zzyzx']
+
+# Settings before the SQLite production profile, for --profile legacy
+LEGACY_SQLITE_ENV = {
+    'SQLITE_JOURNAL_MODE': 'DELETE',
+    'SQLITE_SYNCHRONOUS': 'FULL',
+    'SQLITE_CACHE_SIZE_KB': '2000',
+    'SQLITE_MMAP_SIZE': '0',
+    'DB_WRITE_RETRIES': '0',
+}
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    index = max(int(round(pct / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def server_timing(response):
+    """{metric: milliseconds} from a Server-Timing header (see instrumentation.py)"""
+    timings = {}
+    for entry in response.headers.get('Server-Timing', '').split(','):
+        name, _, params = entry.strip().partition(';')
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key == 'dur':
+                timings[name] = float(value)
+    return timings
+
+
+class QueryCounter:
+    """Counts statements executed on an engine while active"""
+
+    def __init__(self, engine):
+        self.count = 0
+        self._engine = engine
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def close(self):
+        event.remove(self._engine, 'before_cursor_execute', self._on_execute)
+
+
+def run_benchmark(app, routes, iterations, warmup=2, cold=False):
+    """Time each route; returns {route: stats} with times in milliseconds"""
+    from app import db
+    from cache import MemoryBackend
+
+    client = app.test_client()
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+
+    results = {}
+    try:
+        for route in routes:
+            timings = []
+            queries = []
+            sql_times = []
+            render_times = []
+            first_ms = None
+            for i in range(warmup + iterations):
+                if cold:
+                    # Start every request with an empty metrics cache
+                    app.extensions['metrics_cache'] = MemoryBackend()
+                counter.count = 0
+                started = time.perf_counter()
+                response = client.get(route)
+                elapsed = (time.perf_counter() - started) * 1000
+                if response.status_code >= 400:
+                    raise RuntimeError(f'{route} returned {response.status_code}')
+                if first_ms is None:
+                    # Includes compiling (or loading the bytecode of) the page's templates
+                    first_ms = elapsed
+                if i >= warmup:
+                    timings.append(elapsed)
+                    queries.append(counter.count)
+                    timing = server_timing(response)
+                    sql_times.append(timing.get('sql', 0.0))
+                    render_times.append(timing.get('render', 0.0))
+
+            results[route] = {
+                'p50_ms': round(percentile(timings, 50), 3),
+                'p90_ms': round(percentile(timings, 90), 3),
+                'p99_ms': round(percentile(timings, 99), 3),
+                'max_ms': round(max(timings), 3),
+                'queries': max(queries),
+                'sql_p50_ms': round(percentile(sql_times, 50), 3),
+                'render_p50_ms': round(percentile(render_times, 50), 3),
+                'first_ms': round(first_ms, 3),
+            }
+    finally:
+        counter.close()
+
+    return results
+
+
+def _concurrency_worker(role, duration, env, barrier, results):
+    """Run reads or writes for duration seconds in a fresh process"""
+    os.environ.update(env)
+    os.environ['INSTRUMENTATION_ENABLED'] = '0'
+    import logging
+    logging.disable(logging.WARNING)
+    from app import create_app
+    app = create_app()
+    from models import Employee
+
+    client = app.test_client()
+    with app.app_context():
+        employee_id = Employee.query.with_entities(Employee.id).first()[0]
+
+    ok = errors = 0
+    timings = []
+    barrier.wait()
+    deadline = time.perf_counter() + duration
+    i = 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        if role == 'read':
+            response = client.get(CONCURRENCY_READ_ROUTES[i % len(CONCURRENCY_READ_ROUTES)])
+            success = response.status_code == 200
+        elif i % 2:
+            response = client.post('/expenses/add', data={
+                'description': f'Benchmark expense {os.getpid()}-{i}', 'amount': '10',
+                'category': 'Other', 'date_incurred': date.today().isoformat()})
+            success = response.status_code == 302
+        else:
+            response = client.post('/accounts/add', data={
+                'employee_id': employee_id, 'account_names': f'Benchmark {os.getpid()}-{i}',
+                'account_numbers': f'BENCH{os.getpid()}{i}', 'account_status_0': 'good',
+                'date_created': date.today().isoformat()})
+            success = response.status_code == 302
+        timings.append((time.perf_counter() - started) * 1000)
+        ok += success
+        errors += not success
+        i += 1
+
+    results.put((role, ok, errors, timings))
+
+
+def run_concurrency(readers, writers, duration, env=None):
+    """Throughput and latency of concurrent reader and writer processes"""
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(readers + writers)
+    results = context.Queue()
+    processes = [context.Process(target=_concurrency_worker,
+                                 args=(role, duration, env or {}, barrier, results))
+                 for role in ['read'] * readers + ['write'] * writers]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    summary = {}
+    for role in ('read', 'write'):
+        rows = [row for row in collected if row[0] == role]
+        timings = [t for row in rows for t in row[3]]
+        if not timings:
+            continue
+        ok = sum(row[1] for row in rows)
+        summary[role] = {
+            'ok_per_s': round(ok / duration, 1),
+            'errors': sum(row[2] for row in rows),
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+        }
+    return summary
+
+
+def print_concurrency(profile, summary):
+    for role, stats in summary.items():
+        print(f"{profile:<12} {role:<6} {stats['ok_per_s']:>9.1f} {stats['errors']:>7} "
+              f"{stats['p50_ms']:>9.2f} {stats['p99_ms']:>9.2f}")
+
+
+def run_search_benchmark(app, queries, iterations):
+    """First-page search latency via search_accounts and via a LIKE scan"""
+    from sqlalchemy import and_, or_
+    from models import Account
+    import search
+
+    columns = (Account.account_number, Account.client_name, Account.client_email, Account.notes)
+
+    def like_scan(query_text):
+        terms = search.search_terms(query_text)
+        return Account.query.filter(and_(*[
+            or_(*[column.ilike(f'%{term}%') for column in columns]) for term in terms
+        ])).order_by(Account.created_at.desc(), Account.id.desc()).limit(20).all()
+
+    results = {}
+    with app.app_context():
+        from app import db
+        mode = 'fts' if search.has_fts_index(db.session.connection()) else 'prefix-like'
+        for query_text in queries:
+            row = {}
+            for name, func in ((mode, lambda q: search.search_accounts(q).items), ('like-scan', like_scan)):
+                timings = []
+                for _ in range(iterations):
+                    started = time.perf_counter()
+                    found = func(query_text)
+                    timings.append((time.perf_counter() - started) * 1000)
+                row[name] = {'p50_ms': round(percentile(timings, 50), 2), 'hits': len(found)}
+            results[query_text] = row
+    return results
+
+
+def run_template_benchmark(app, iterations):
+    """Time loading every template into a fresh environment, from source and from bytecode"""
+    results = {}
+    for name, bytecode_cache in (('compile', None), ('bytecode-cache', app.jinja_env.bytecode_cache)):
+        timings = []
+        for i in range(iterations + 1):
+            env = app.create_jinja_environment()
+            env.bytecode_cache = bytecode_cache
+            started = time.perf_counter()
+            templates = env.list_templates(extensions=['html'])
+            for template in templates:
+                env.get_template(template)
+            # The first pass only fills the bytecode cache
+            if i:
+                timings.append((time.perf_counter() - started) * 1000)
+        results[name] = {'p50_ms': round(percentile(timings, 50), 2), 'templates': len(templates)}
+    return results
+
+
+def find_regressions(results, baseline, threshold):
+    """List human-readable regressions of results against baseline"""
+    regressions = []
+    for route, stats in results.items():
+        previous = baseline.get(route)
+        if previous is None:
+            continue
+        for metric in ('p50_ms', 'p90_ms'):
+            if stats[metric] > previous[metric] * (1 + threshold):
+                regressions.append(f'{route}: {metric} {previous[metric]:.2f} -> {stats[metric]:.2f}')
+        if stats['queries'] > previous['queries']:
+            regressions.append(f"{route}: queries {previous['queries']} -> {stats['queries']}")
+    return regressions
+
+
+def print_results(results, baseline=None):
+    print(f"{'route':<32} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'queries':>8}"
+          f" {'sql ms':>8} {'render ms':>10} {'first ms':>9}")
+    for route, stats in results.items():
+        line = (f"{route:<32} {stats['p50_ms']:>9.2f} {stats['p90_ms']:>9.2f} "
+                f"{stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f} {stats['queries']:>8}"
+                f" {stats.get('sql_p50_ms', 0.0):>8.2f} {stats.get('render_p50_ms', 0.0):>10.2f}"
+                f" {stats.get('first_ms', 0.0):>9.2f}")
+        if baseline and route in baseline:
+            line += f"   (baseline p50 {baseline[route]['p50_ms']:.2f})"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('routes', nargs='*', help='Routes to benchmark (default: all dashboard routes)')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--cold', action='store_true', help='Empty the metrics cache before every request')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+    parser.add_argument('--compare', action='store_true', help='Fail on regressions against the baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed slowdown before flagging a regression (0.25 = 25%%)')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    parser.add_argument('--concurrency', action='store_true',
+                        help='Run concurrent reader/writer processes instead of the route suite')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per concurrency run')
+    parser.add_argument('--profile', choices=['production', 'legacy', 'both'], default='production',
+                        help='SQLite settings for the concurrency run')
+    parser.add_argument('--search', action='store_true',
+                        help='Benchmark account search against a LIKE scan instead of the route suite')
+    parser.add_argument('--templates', action='store_true',
+                        help='Time template compilation with and without the bytecode cache')
+    args = parser.parse_args(argv)
+
+    if args.templates:
+        from app import create_app
+        results = run_template_benchmark(create_app(), args.iterations)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print(f"{'templates':<16} {'p50 ms':>9} {'count':>6}")
+            for name, stats in results.items():
+                print(f"{name:<16} {stats['p50_ms']:>9.2f} {stats['templates']:>6}")
+        return 0
+
+    if args.search:
+        from app import create_app
+        results = run_search_benchmark(create_app(), args.routes or SEARCH_QUERIES, args.iterations)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print(f"{'query':<16} {'method':<12} {'p50 ms':>9} {'hits':>5}")
+            for query_text, row in results.items():
+                for method, stats in row.items():
+                    print(f"{query_text:<16} {method:<12} {stats['p50_ms']:>9.2f} {stats['hits']:>5}")
+        return 0
+
+    if args.concurrency:
+        profiles = ['legacy', 'production'] if args.profile == 'both' else [args.profile]
+        summaries = {}
+        for profile in profiles:
+            env = LEGACY_SQLITE_ENV if profile == 'legacy' else {}
+            summaries[profile] = run_concurrency(args.readers, args.writers, args.duration, env)
+        if args.json:
+            print(json.dumps(summaries, indent=2))
+        else:
+            print(f"{'profile':<12} {'role':<6} {'ok/s':>9} {'errors':>7} {'p50 ms':>9} {'p99 ms':>9}")
+            for profile, summary in summaries.items():
+                print_concurrency(profile, summary)
+        return 0
+
+    from app import create_app
+    app = create_app()
+
+    results = run_benchmark(app, args.routes or DEFAULT_ROUTES, args.iterations,
+                            args.warmup, args.cold)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results, baseline)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Saved baseline to {args.baseline}')
+
+    if args.compare:
+        if baseline is None:
+            print(f'No baseline at {args.baseline}; run with --save-baseline first.')
+            return 1
+        regressions = find_regressions(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,325 @@
+"""Write-invalidated cache for dashboard metrics.
+
+The backend is chosen by ``METRICS_CACHE_URL``:
+
+* ``memory://`` keeps up to 64 MB of entries in the worker process. Each
+  gunicorn worker then only sees its own invalidations, so use it for a
+  single worker.
+* ``file:///path/to/dir`` shares entries between workers on one host;
+  expired files are swept every few minutes.
+* ``redis://host:port/db`` shares entries between hosts (needs ``redis``).
+
+Week summaries are cached per week_start and dropped by the write routes as
+soon as a commit touches that week. Rendered page fragments are cached against
+the data version, so they go stale on any write.
+"""
+import os
+import pickle
+import hashlib
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from markupsafe import Markup
+
+
+class MemoryBackend:
+    """Process-local dict backend holding at most max_entries keys and max_bytes of values"""
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024):
+        self._entries = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def _size(value):
+        # Close enough to the memory held, and cheap next to building the value
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value, _ = entry
+            if expires_at is not None and expires_at < time.time():
+                self._remove(key)
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        size = self._size(value)
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (expires_at, value, size)
+            self._bytes += size
+            if len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Expired entries go first, then the least recently written
+        now = time.time()
+        for key in [key for key, (expires_at, _, _) in self._entries.items()
+                    if expires_at is not None and expires_at < now]:
+            self._remove(key)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+
+class FileBackend:
+    """One pickle file per key in a shared directory.
+
+    A file's mtime is set to its expiry, so sweep() finds expired entries
+    with a stat per file. Each process sweeps at most every sweep_interval
+    seconds, from set().
+    """
+
+    def __init__(self, directory, sweep_interval=300):
+        self.directory = directory
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+        self._sweep_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    @staticmethod
+    def _load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            expires_at, value = self._load(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires_at is not None and expires_at < time.time():
+            # At worst this drops an entry another worker has just rewritten
+            self._remove(path)
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        # Write to a temp file and rename so readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((expires_at, value), f)
+        if expires_at is not None:
+            os.utime(temp_path, (expires_at, expires_at))
+        os.replace(temp_path, self._path(key))
+
+        if time.monotonic() >= self._next_sweep:
+            self.sweep()
+
+    def sweep(self):
+        """Delete expired entries and abandoned temp files. Returns the number removed."""
+        if not self._sweep_lock.acquire(blocking=False):
+            return 0
+        try:
+            self._next_sweep = time.monotonic() + self.sweep_interval
+            now = time.time()
+            removed = 0
+            for entry in os.scandir(self.directory):
+                try:
+                    if entry.stat().st_mtime >= now:
+                        continue
+                    # Entries without a TTL keep their write time; only drop
+                    # files that really are expired, or unreadable and old
+                    expires_at, _ = self._load(entry.path)
+                    if expires_at is None or expires_at >= now:
+                        continue
+                except (EOFError, pickle.UnpicklingError, ValueError):
+                    if entry.stat().st_mtime >= now - self.sweep_interval:
+                        continue
+                except OSError:
+                    continue
+                self._remove(entry.path)
+                removed += 1
+            return removed
+        finally:
+            self._sweep_lock.release()
+
+    def delete(self, *keys):
+        for key in keys:
+            self._remove(self._path(key))
+
+
+class RedisBackend:
+    """Redis backend shared by every worker and host"""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('METRICS_CACHE_URL uses redis:// but the redis package is not installed')
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self._client.set(key, pickle.dumps(value), ex=ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*keys)
+
+
+def make_backend(url):
+    """Build a cache backend from its URL"""
+    if url.startswith('memory://'):
+        return MemoryBackend()
+    if url.startswith('file://'):
+        return FileBackend(url[len('file://'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    raise ValueError(f'Unsupported METRICS_CACHE_URL: {url}')
+
+
+class MetricsCache:
+    """Per-week metric cache with a global data version for HTTP validators"""
+
+    VERSION_KEY = 'metrics:version'
+    EMPLOYEES_KEY = 'metrics:active-employees'
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_CACHE_URL', 'memory://')
+        app.config.setdefault('METRICS_CACHE_TTL', 3600)
+        app.extensions['metrics_cache'] = make_backend(app.config['METRICS_CACHE_URL'])
+
+    @property
+    def backend(self):
+        return current_app.extensions['metrics_cache']
+
+    @property
+    def ttl(self):
+        return current_app.config['METRICS_CACHE_TTL']
+
+    @staticmethod
+    def week_key(week_start):
+        return f'metrics:week:{week_start.isoformat()}'
+
+    @staticmethod
+    def week_stamp_key(week_start):
+        return f'metrics:week-invalidated:{week_start.isoformat()}'
+
+    def get_weeks(self, week_starts):
+        """Cached week summaries keyed by week_start (misses are left out).
+
+        Entries are stored with the data version they were computed at. One
+        computed before the last invalidation of its week is a miss, even if
+        it was stored after that invalidation.
+        """
+        cached = {}
+        for week_start in week_starts:
+            entry = self.backend.get(self.week_key(week_start))
+            if not isinstance(entry, tuple):
+                continue
+            version, summary = entry
+            stamp = self.backend.get(self.week_stamp_key(week_start))
+            if stamp is None or version >= stamp:
+                cached[week_start] = summary
+        return cached
+
+    def set_weeks(self, summaries, version):
+        """Store week summaries computed while the data was at version.
+
+        Skipped if a write invalidated the cache while they were computed.
+        """
+        if self.version() != version:
+            return
+        for summary in summaries:
+            self.backend.set(self.week_key(summary['week_start']), (version, summary), self.ttl)
+
+    def get_active_employees(self):
+        return self.backend.get(self.EMPLOYEES_KEY)
+
+    def set_active_employees(self, count, version):
+        if self.version() == version:
+            self.backend.set(self.EMPLOYEES_KEY, count, self.ttl)
+
+    def version(self):
+        """Timestamp of the last invalidation, used as ETag and Last-Modified"""
+        version = self.backend.get(self.VERSION_KEY)
+        if version is None:
+            # Unknown after a restart or eviction, so start a new version now
+            version = time.time()
+            self.backend.set(self.VERSION_KEY, version)
+        return version
+
+    def last_modified(self):
+        return datetime.fromtimestamp(int(self.version()), tz=timezone.utc)
+
+    def _bump(self):
+        self.backend.set(self.VERSION_KEY, time.time())
+
+    def invalidate(self):
+        """Start a new data version, for writes that leave every week summary unchanged"""
+        self._bump()
+
+    def fragment(self, name, key, render, version=None):
+        """Rendered HTML for name and key, calling render() only when stale.
+
+        Each entry records the data version it was rendered at, so any write
+        that bumps the version retires every fragment without deleting them.
+        When render() uses data read before the call, pass the version that
+        data was read at; the result is then only cached if it is current.
+        """
+        cache_key = f'fragment:{name}:{key}'
+        current = self.version()
+        version = current if version is None else version
+        if version == current:
+            entry = self.backend.get(cache_key)
+            if entry is not None and entry[0] == version:
+                return Markup(entry[1])
+
+        html = str(render())
+        if self.version() == version:
+            self.backend.set(cache_key, (version, html), self.ttl)
+        return Markup(html)
+
+    def invalidate_weeks(self, days):
+        """Drop the cached summaries for the weeks containing the given days"""
+        week_starts = {day - timedelta(days=day.weekday()) for day in days}
+        # The stamp rejects summaries a reader computed before this write but
+        # stores after it; it outlives any entry it has to reject
+        now = time.time()
+        for week_start in week_starts:
+            self.backend.set(self.week_stamp_key(week_start), now, 2 * self.ttl)
+        self.backend.delete(*[self.week_key(week_start) for week_start in week_starts])
+        self.backend.set(self.VERSION_KEY, now)
+
+    def invalidate_employees(self):
+        """Drop cached employee-derived metrics"""
+        self.backend.delete(self.EMPLOYEES_KEY)
+        self._bump()
+
+
+metrics_cache = MetricsCache()
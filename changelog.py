@@ -0,0 +1,159 @@
+"""Change feed of employee, account and expense writes for downstream sync.
+
+On SQLite, triggers append a ``change_log`` row for every INSERT into and
+UPDATE of ``employee``, ``account`` and ``expense``, inside the transaction
+that made the write. That covers the write routes as well as the executemany
+INSERTs of CSV imports and seeding, and a rolled-back write leaves no entry.
+An update that deactivates an employee is logged as ``deactivate``.
+Archiving moves rows without changing them, so it is not logged.
+
+``/api/changes?after=<cursor>`` returns the entries after a cursor, oldest
+first, each with the record's current fields. SQLite has a single writer, so
+entries become visible in id order and a consumer that stores the last
+cursor it processed never skips one. A new consumer notes ``latest_cursor``,
+takes a full export and then follows the feed from that cursor; entries it
+replays carry the current record, so applying them again is harmless.
+
+Entries older than CHANGE_LOG_RETENTION_DAYS are pruned with
+``flask prune-change-log``; a cursor from before the oldest entry left gets a
+410 and must resync from an export.
+"""
+from datetime import date, datetime, timedelta
+from flask import current_app
+from sqlalchemy import text, func
+from app import db
+from database import run_write
+from models import Employee, Account, Expense, ArchivedAccount, ArchivedExpense, ChangeLog
+
+# entity name -> (live model, archive model or None)
+ENTITIES = {
+    'employee': (Employee, None),
+    'account': (Account, ArchivedAccount),
+    'expense': (Expense, ArchivedExpense),
+}
+
+PRUNE_BATCH_SIZE = 10000
+
+
+def _trigger_ddl(entity, model):
+    table = model.__table__.name
+    if entity == 'employee':
+        update_op = "CASE WHEN old.is_active AND NOT new.is_active THEN 'deactivate' ELSE 'update' END"
+    else:
+        update_op = "'update'"
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_change_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO change_log(entity, entity_id, op) VALUES ('{entity}', new.id, 'insert');
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_change_update AFTER UPDATE ON {table} BEGIN
+            INSERT INTO change_log(entity, entity_id, op) VALUES ('{entity}', new.id, {update_op});
+        END""",
+    ]
+
+
+def create_change_log(connection):
+    """Create the change_log table and its triggers.
+
+    Returns False, changing nothing, on databases other than SQLite.
+    """
+    if connection.dialect.name != 'sqlite':
+        return False
+    ChangeLog.__table__.create(connection, checkfirst=True)
+    for entity, (model, _) in ENTITIES.items():
+        for statement in _trigger_ddl(entity, model):
+            connection.execute(text(statement))
+    return True
+
+
+def is_supported():
+    return db.engine.dialect.name == 'sqlite'
+
+
+class CursorExpired(ValueError):
+    pass
+
+
+def _value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _load_records(entity, ids):
+    """Current fields of the given records by id, live or archived"""
+    model, archived_model = ENTITIES[entity]
+    sources = [(model, False)] + ([(archived_model, True)] if archived_model else [])
+    records = {}
+    for source_model, archived in sources:
+        missing = [entity_id for entity_id in ids if entity_id not in records]
+        if not missing:
+            break
+        source = source_model.__table__
+        columns = [source.c[column.name] for column in model.__table__.columns]
+        for row in db.session.execute(db.select(*columns).where(source.c.id.in_(missing))).mappings():
+            record = {name: _value(value) for name, value in row.items()}
+            if archived_model is not None:
+                record['archived'] = archived
+            records[row['id']] = record
+    return records
+
+
+def changes_after(cursor, limit):
+    """Up to limit change log entries after cursor, with their records.
+
+    Raises CursorExpired if entries after cursor have been pruned.
+    """
+    oldest = db.session.query(func.min(ChangeLog.id)).scalar()
+    if oldest is not None and cursor < oldest - 1:
+        raise CursorExpired(f'Changes after {cursor} have been pruned; resync from an export')
+
+    entries = ChangeLog.query.filter(ChangeLog.id > cursor).order_by(ChangeLog.id).limit(limit + 1).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    ids = {}
+    for entry in entries:
+        ids.setdefault(entry.entity, set()).add(entry.entity_id)
+    records = {entity: _load_records(entity, entity_ids) for entity, entity_ids in ids.items()}
+
+    return {
+        'changes': [{
+            'cursor': entry.id,
+            'entity': entry.entity,
+            'id': entry.entity_id,
+            'op': entry.op,
+            'changed_at': _value(entry.changed_at),
+            'record': records[entry.entity].get(entry.entity_id),
+        } for entry in entries],
+        'next_cursor': entries[-1].id if entries else cursor,
+        'has_more': has_more,
+        'latest_cursor': db.session.query(func.max(ChangeLog.id)).scalar() or 0,
+    }
+
+
+def _prune_batch(boundary, batch_size):
+    table = ChangeLog.__table__
+    ids = db.select(table.c.id).where(table.c.id < boundary).order_by(table.c.id).limit(batch_size)
+    return db.session.execute(table.delete().where(table.c.id.in_(ids))).rowcount
+
+
+def prune_change_log(days=None, batch_size=PRUNE_BATCH_SIZE):
+    """Delete entries older than days, keeping the newest. Returns the number deleted."""
+    if days is None:
+        days = current_app.config['CHANGE_LOG_RETENTION_DAYS']
+    cutoff = datetime.utcnow() - timedelta(days=days)
+
+    # Ids grow with changed_at, so everything below the first recent entry
+    # goes; the newest entry always stays to mark where the log resumes
+    newest = db.session.query(func.max(ChangeLog.id)).scalar()
+    if newest is None:
+        return 0
+    boundary = (db.session.query(ChangeLog.id).filter(ChangeLog.changed_at >= cutoff)
+                .order_by(ChangeLog.id).limit(1).scalar()) or newest
+
+    deleted = 0
+    while True:
+        count = run_write(_prune_batch, boundary, batch_size)
+        if not count:
+            return deleted
+        deleted += count
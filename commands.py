@@ -0,0 +1,208 @@
+import click
+from datetime import datetime
+from flask.cli import with_appcontext
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+@click.command('rebuild-weekly-reports')
+@click.option('--start', help='First day to rebuild (YYYY-MM-DD). Defaults to the oldest data.')
+@click.option('--end', help='Last day to rebuild (YYYY-MM-DD). Defaults to the newest data.')
+@with_appcontext
+def rebuild_weekly_reports_command(start, end):
+    """Backfill or repair the WeeklyReport rollups from raw rows."""
+    from reporting import rebuild_weekly_reports
+
+    rebuilt = rebuild_weekly_reports(_parse_date(start), _parse_date(end))
+    click.echo(f'Rebuilt {rebuilt} weekly reports.')
+
+
+@click.command('init-db')
+@click.option('--check', is_flag=True, help='Only report whether the schema is current; exit 1 if not.')
+@with_appcontext
+def init_db_command(check):
+    """Create the schema or bring it up to date."""
+    import migrations
+
+    if check:
+        pending = migrations.pending_migrations()
+        for version, description in pending:
+            click.echo(f'Pending migration {version}: {description}')
+        if pending:
+            raise click.ClickException('Schema is out of date; run flask init-db.')
+        click.echo(f'Schema is at version {migrations.SCHEMA_VERSION}.')
+        return
+
+    for version, description in migrations.init_db():
+        click.echo(f'Applied migration {version}: {description}')
+    click.echo(f'Schema is at version {migrations.SCHEMA_VERSION}.')
+
+
+@click.command('db-upgrade')
+@with_appcontext
+def db_upgrade_command():
+    """Apply pending schema migrations in place."""
+    import migrations
+
+    applied = migrations.upgrade()
+    for version, description in applied:
+        click.echo(f'Applied migration {version}: {description}')
+    click.echo(f'Schema is at version {migrations.SCHEMA_VERSION}.')
+
+
+@click.command('explain-hot-queries')
+@click.option('--verbose', is_flag=True, help='Print the full plan for every query.')
+@with_appcontext
+def explain_hot_queries_command(verbose):
+    """Check that every hot query is served by an index."""
+    import migrations
+
+    failures = 0
+    for name, plan, uses_index in migrations.explain_hot_queries():
+        click.echo(f"{'ok  ' if uses_index else 'SCAN'} {name}")
+        if verbose or not uses_index:
+            for line in plan:
+                click.echo(f'       {line}')
+        failures += not uses_index
+
+    if failures:
+        raise click.ClickException(f'{failures} hot queries do a full table scan.')
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Re-index every account for full-text search."""
+    import search
+
+    if not search.rebuild_index():
+        raise click.ClickException('This database has no FTS5 support; search uses LIKE matching.')
+    click.echo('Rebuilt the account search index.')
+
+
+@click.command('archive-history')
+@click.option('--before', help='Archive rows dated before this day (YYYY-MM-DD), rounded down to a Monday.')
+@click.option('--weeks', type=int, help='Keep this many weeks live. Defaults to ARCHIVE_AFTER_WEEKS.')
+@click.option('--batch-size', type=int, help='Rows moved per transaction. Defaults to ARCHIVE_BATCH_SIZE.')
+@with_appcontext
+def archive_history_command(before, weeks, batch_size):
+    """Move old accounts and expenses into the archive tables."""
+    import archive
+
+    cutoff = _parse_date(before) or archive.archive_horizon(weeks)
+
+    def progress(name, moved):
+        click.echo(f'  {name}: {moved}')
+
+    moved = archive.archive_before(cutoff, batch_size, progress)
+    click.echo(f"Archived {moved['accounts']} accounts and {moved['expenses']} expenses "
+               f"dated before {archive.week_start_for(cutoff).isoformat()}.")
+
+
+@click.command('prune-change-log')
+@click.option('--days', type=int, help='Keep this many days of changes. Defaults to CHANGE_LOG_RETENTION_DAYS.')
+@with_appcontext
+def prune_change_log_command(days):
+    """Delete old entries from the sync change log."""
+    import changelog
+
+    if not changelog.is_supported():
+        raise click.ClickException('The change log needs SQLite.')
+    deleted = changelog.prune_change_log(days)
+    click.echo(f'Deleted {deleted} change log entries.')
+
+
+@click.command('build-assets')
+@click.option('--brotli/--no-brotli', default=None,
+              help='Write .br files too. Defaults to doing so if the brotli package is installed.')
+@with_appcontext
+def build_assets_command(brotli):
+    """Fingerprint and precompress the static files."""
+    import os
+    from flask import current_app
+    import assets
+
+    try:
+        manifest = assets.build_assets(current_app, brotli)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+
+    output = assets.build_dir(current_app)
+    for filename, hashed in sorted(manifest.items()):
+        path = os.path.join(output, hashed)
+        sizes = [f'{os.path.getsize(path)} B']
+        for _, suffix in assets.ENCODINGS:
+            if os.path.exists(path + suffix):
+                sizes.append(f'{suffix[1:]} {os.path.getsize(path + suffix)} B')
+        click.echo(f"{filename} -> {hashed} ({', '.join(sizes)})")
+    click.echo(f'Wrote {len(manifest)} assets to {output}.')
+
+
+def _report_import(result, kind):
+    for line, message in result.errors:
+        click.echo(f'line {line}: {message}', err=True)
+    if result.truncated:
+        click.echo(f'... {result.rejected - len(result.errors)} more errors not shown', err=True)
+    click.echo(f'Imported {result.inserted} {kind}, rejected {result.rejected} rows.')
+
+
+@click.command('import-accounts')
+@click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--chunk-size', type=int, help='Rows per INSERT. Defaults to IMPORT_CHUNK_SIZE.')
+@with_appcontext
+def import_accounts_command(csv_file, chunk_size):
+    """Bulk import accounts from CSV_FILE."""
+    from flask import current_app
+    from importer import import_accounts_csv
+
+    result = import_accounts_csv(csv_file, chunk_size or current_app.config['IMPORT_CHUNK_SIZE'])
+    _report_import(result, 'accounts')
+
+
+@click.command('import-expenses')
+@click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--chunk-size', type=int, help='Rows per INSERT. Defaults to IMPORT_CHUNK_SIZE.')
+@with_appcontext
+def import_expenses_command(csv_file, chunk_size):
+    """Bulk import expenses from CSV_FILE."""
+    from flask import current_app
+    from importer import import_expenses_csv
+
+    result = import_expenses_csv(csv_file, chunk_size or current_app.config['IMPORT_CHUNK_SIZE'])
+    _report_import(result, 'expenses')
+
+
+@click.command('seed')
+@click.option('--employees', default=50, show_default=True)
+@click.option('--accounts', default=10000, show_default=True)
+@click.option('--expenses', default=1000, show_default=True)
+@click.option('--years', default=1.0, show_default=True, help='Span of history to generate.')
+@click.option('--batch-size', default=20000, show_default=True, help='Rows per INSERT.')
+@click.option('--random-seed', default=42, show_default=True)
+@with_appcontext
+def seed_command(employees, accounts, expenses, years, batch_size, random_seed):
+    """Fill the database with synthetic benchmark data."""
+    from seed import seed_database
+
+    def progress(model, inserted):
+        click.echo(f'  {model}: {inserted}')
+
+    counts = seed_database(employees, accounts, expenses, years, batch_size, random_seed, progress)
+    click.echo(', '.join(f'{count} {name}' for name, count in counts.items()))
+
+
+def register_commands(app):
+    """Attach the management commands to the Flask CLI"""
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(rebuild_weekly_reports_command)
+    app.cli.add_command(db_upgrade_command)
+    app.cli.add_command(explain_hot_queries_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(archive_history_command)
+    app.cli.add_command(prune_change_log_command)
+    app.cli.add_command(build_assets_command)
+    app.cli.add_command(import_accounts_command)
+    app.cli.add_command(import_expenses_command)
+    app.cli.add_command(seed_command)
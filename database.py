@@ -0,0 +1,125 @@
+"""Engine settings per database backend, and write retries.
+
+SQLite gets a production profile: WAL journaling so readers no longer block
+on the writer, tuned synchronous/cache_size/mmap_size pragmas on every new
+connection, and a busy timeout so a writer waits for the lock instead of
+failing at once. The pool holds one connection per thread that can use the
+database in a worker (request threads plus job threads); more would only
+queue up behind SQLite's single writer.
+
+``run_write`` commits a unit of work and, if it still hits "database is
+locked", rolls back and runs the whole unit again with jittered exponential
+backoff.
+"""
+import time
+import random
+import logging
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from flask import current_app
+from app import db
+
+logger = logging.getLogger(__name__)
+
+LOCK_ERRORS = ('database is locked', 'database table is locked', 'database schema is locked')
+
+
+def is_sqlite(uri):
+    return uri.startswith('sqlite')
+
+
+def _is_memory(uri):
+    return uri in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in uri
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database"""
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    threads = config.get('WEB_THREADS', 4) + config.get('JOB_WORKERS', 2)
+
+    if not is_sqlite(uri):
+        return {
+            'pool_recycle': 300,
+            'pool_pre_ping': True,
+            'pool_size': threads,
+            'max_overflow': threads,
+        }
+
+    if _is_memory(uri):
+        # In-memory databases keep their own single-connection pool
+        return {}
+
+    return {
+        # Local files never go stale, so there is nothing to ping or recycle
+        'pool_size': threads,
+        'max_overflow': 0,
+        'pool_timeout': 30,
+        'connect_args': {
+            'timeout': config.get('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000.0,
+            'check_same_thread': False,
+        },
+    }
+
+
+def sqlite_pragmas(config):
+    """PRAGMA statements run on every new SQLite connection"""
+    return [
+        f"PRAGMA journal_mode={config.get('SQLITE_JOURNAL_MODE', 'WAL')}",
+        f"PRAGMA synchronous={config.get('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+        # Negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size=-{int(config.get('SQLITE_CACHE_SIZE_KB', 65536))}",
+        f"PRAGMA mmap_size={int(config.get('SQLITE_MMAP_SIZE', 268435456))}",
+        f"PRAGMA busy_timeout={int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}",
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+
+def init_app(app):
+    """Apply the SQLite pragmas to every connection the app's engine opens"""
+    app.config.setdefault('DB_WRITE_RETRIES', 5)
+    app.config.setdefault('DB_RETRY_BASE_DELAY', 0.05)
+
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite' or _is_memory(app.config['SQLALCHEMY_DATABASE_URI']):
+        return
+
+    pragmas = sqlite_pragmas(app.config)
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def is_lock_error(error):
+    message = str(getattr(error, 'orig', error)).lower()
+    return any(lock_error in message for lock_error in LOCK_ERRORS)
+
+
+def run_write(work, *args, **kwargs):
+    """Run work(*args, **kwargs) and commit, retrying the whole unit when locked.
+
+    work must make all of its session changes itself, since a rollback
+    discards them before the next attempt. Returns work's result.
+    """
+    retries = current_app.config['DB_WRITE_RETRIES']
+    base_delay = current_app.config['DB_RETRY_BASE_DELAY']
+
+    for attempt in range(retries + 1):
+        try:
+            result = work(*args, **kwargs)
+            db.session.commit()
+            return result
+        except OperationalError as e:
+            db.session.rollback()
+            if attempt == retries or not is_lock_error(e):
+                raise
+            delay = base_delay * 2 ** attempt * random.uniform(0.5, 1.5)
+            logger.warning('Database locked, retrying write in %.0f ms (attempt %d of %d)',
+                           delay * 1000, attempt + 1, retries)
+            time.sleep(delay)
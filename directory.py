@@ -0,0 +1,67 @@
+"""In-process directory of active employees for dropdowns.
+
+The roster changes a few times a month but fills a ``<select>`` on most
+pages. Each worker keeps (id, name, department) tuples in memory, stamped
+with the directory version held in the metrics cache backend. The employee
+write routes bump that version, so with a shared backend every worker
+reloads on its next request; with ``memory://`` only the worker that made
+the change does.
+"""
+import threading
+import time
+from collections import namedtuple
+from flask import current_app
+from app import db
+from cache import metrics_cache
+from models import Employee
+
+DirectoryEntry = namedtuple('DirectoryEntry', 'id name department')
+
+
+class EmployeeDirectory:
+    """Versioned per-worker cache of the active employee list"""
+
+    VERSION_KEY = 'directory:employees:version'
+
+    def init_app(self, app):
+        app.extensions['employee_directory'] = {
+            'lock': threading.Lock(),
+            'version': None,
+            'entries': (),
+        }
+
+    @property
+    def _state(self):
+        return current_app.extensions['employee_directory']
+
+    def version(self):
+        version = metrics_cache.backend.get(self.VERSION_KEY)
+        if version is None:
+            version = time.time()
+            metrics_cache.backend.set(self.VERSION_KEY, version)
+        return version
+
+    def active(self):
+        """Active employees as DirectoryEntry tuples, ordered by id"""
+        state = self._state
+        version = self.version()
+        with state['lock']:
+            if state['version'] == version:
+                return state['entries']
+
+        rows = db.session.query(Employee.id, Employee.name, Employee.department).filter(
+            Employee.is_active.is_(True)).order_by(Employee.id).all()
+        entries = tuple(DirectoryEntry(*row) for row in rows)
+
+        # A write that lands meanwhile bumps the version again, so at worst
+        # the next request reloads
+        with state['lock']:
+            state['version'], state['entries'] = version, entries
+        return entries
+
+    def invalidate(self):
+        """Make every worker reload the directory on its next request"""
+        metrics_cache.backend.set(self.VERSION_KEY, time.time())
+
+
+employee_directory = EmployeeDirectory()
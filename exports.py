@@ -0,0 +1,114 @@
+"""Streaming CSV/NDJSON exports.
+
+Rows are fetched through a server-side cursor in batches of EXPORT_BATCH_SIZE
+and serialised into a generator, so memory stays flat however many rows match.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from app import db
+from filters import filter_accounts, filter_expenses
+from models import Employee, Account, Expense, ArchivedAccount, ArchivedExpense
+from reporting import weekly_summary
+
+EXPORT_BATCH_SIZE = 1000
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+ACCOUNT_COLUMNS = ('id', 'account_number', 'client_name', 'client_email', 'is_good', 'notes',
+                   'date_created', 'created_at', 'employee_id', 'employee_name')
+EXPENSE_COLUMNS = ('id', 'description', 'amount', 'category', 'date_incurred', 'created_at')
+WEEKLY_REPORT_COLUMNS = ('week_start', 'week_end', 'total_accounts', 'good_accounts', 'revenue',
+                         'employee_payments', 'expenses', 'net_profit')
+
+
+def _stream_rows(statement):
+    """Yield result rows without buffering the whole result"""
+    result = db.session.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for partition in result.partitions():
+        yield from partition
+
+
+def account_rows(employee_id=None, week_start=None, archived=False):
+    model = ArchivedAccount if archived else Account
+    statement = db.select(
+        model.id, model.account_number, model.client_name, model.client_email,
+        model.is_good, model.notes, model.date_created, model.created_at,
+        model.employee_id, Employee.name
+    ).outerjoin(Employee, Employee.id == model.employee_id).order_by(model.id)
+    return _stream_rows(filter_accounts(statement, employee_id, week_start, model))
+
+
+def expense_rows(category=None, archived=False):
+    model = ArchivedExpense if archived else Expense
+    statement = db.select(
+        model.id, model.description, model.amount, model.category,
+        model.date_incurred, model.created_at
+    ).order_by(model.id)
+    return _stream_rows(filter_expenses(statement, category, model))
+
+
+def weekly_report_rows(weeks=4):
+    for week in weekly_summary(weeks):
+        yield tuple(week[column] for column in WEEKLY_REPORT_COLUMNS)
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'Cannot serialise {type(value).__name__}')
+
+
+def _encode_csv(columns, rows, batch_rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % batch_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _encode_ndjson(columns, rows, batch_rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, row)), default=_json_default))
+        if len(lines) >= batch_rows:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def encode(columns, rows, fmt, compress=False, batch_rows=EXPORT_BATCH_SIZE):
+    """Serialise rows as CSV or NDJSON chunks, optionally gzipped on the fly"""
+    encoder = _encode_csv if fmt == 'csv' else _encode_ndjson
+    chunks = (chunk.encode('utf-8') for chunk in encoder(columns, rows, batch_rows))
+    if not compress:
+        return chunks
+    return _gzip(chunks)
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def write_export(path, columns, rows, fmt, compress=False):
+    """Write an export to a file instead of streaming it"""
+    with open(path, 'wb') as f:
+        for chunk in encode(columns, rows, fmt, compress):
+            f.write(chunk)
+    return path
@@ -0,0 +1,25 @@
+from models import Account, Expense
+from datetime import datetime, timedelta
+
+
+def filter_accounts(query, employee_id=None, week_start=None, model=Account):
+    """Apply the /accounts list filters to an Account (or ArchivedAccount) query or select"""
+    # Filter by employee
+    if employee_id:
+        query = query.filter(model.employee_id == employee_id)
+    
+    # Filter by week
+    if week_start:
+        start_date = datetime.strptime(week_start, '%Y-%m-%d').date()
+        end_date = start_date + timedelta(days=6)
+        query = query.filter(model.date_created >= start_date, model.date_created <= end_date)
+    
+    return query
+
+
+def filter_expenses(query, category=None, model=Expense):
+    """Apply the /expenses list filters to an Expense (or ArchivedExpense) query or select"""
+    if category:
+        query = query.filter(model.category == category)
+    
+    return query
@@ -0,0 +1,74 @@
+"""Gunicorn settings for running the app in production.
+
+    flask init-db
+    gunicorn -c gunicorn.conf.py
+
+``main.py`` only starts Flask's development server. Here the app is built
+once in the master (preload_app) and forked into every worker, so a new or
+recycled worker starts serving at once. Each worker runs WEB_THREADS request
+threads, which is also what the database pool is sized for (database.py).
+
+Settings below can be overridden from the environment or on the command
+line. To roll out new code without dropping connections, send USR2 to the
+master to start a new one beside it, then QUIT to the old master once the
+new workers are up. HUP only restarts the workers from the code the master
+already loaded, so it picks up configuration changes but not new code.
+"""
+import multiprocessing
+import os
+
+wsgi_app = 'main:app'
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+
+# Import and build the app once, before forking
+preload_app = True
+
+cores = multiprocessing.cpu_count()
+workers = int(os.environ.get('WEB_CONCURRENCY', cores * 2 + 1))
+worker_class = 'gthread'
+# The app reads WEB_THREADS too, to size its connection pool
+threads = int(os.environ.setdefault('WEB_THREADS', '4'))
+
+# Workers must share the metrics cache: it holds the data version that
+# invalidates cached pages and the employee directory, and the job records
+# that any worker may be polled for. memory:// is private to one process.
+os.environ.setdefault('METRICS_CACHE_URL', 'file://' + os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'instance', 'cache'))
+if workers > 1 and os.environ['METRICS_CACHE_URL'].startswith('memory://'):
+    raise RuntimeError('METRICS_CACHE_URL=memory:// only works with WEB_CONCURRENCY=1; '
+                       'use a file:// or redis:// cache with several workers')
+
+# Every live dashboard holds a thread for up to STREAM_MAX_AGE; leave at least
+# half of them for ordinary requests. Dashboards turned away fall back to polling.
+os.environ.setdefault('STREAM_MAX_CLIENTS', str(max(threads // 2, 1)))
+
+# Long reports and exports run as background jobs, but a 52-week report or a
+# large streamed export can still take a while on a cold cache
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+
+# Recycle workers now and then so slow leaks cannot build up; the jitter keeps
+# them from all restarting at once
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 100))
+
+# Heartbeat files on tmpfs, so a slow disk cannot make workers look hung
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = os.environ.get('ACCESS_LOG', '-') or None
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
+
+
+def when_ready(server):
+    server.log.info('Serving with %d workers x %d threads', workers, threads)
+
+
+def post_fork(server, worker):
+    # Connections opened in the master must not be shared with the workers
+    from app import db
+    from main import app
+    with app.app_context():
+        db.engine.dispose(close=False)
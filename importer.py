@@ -0,0 +1,202 @@
+"""Streaming CSV import for accounts and expenses.
+
+Rows are validated one at a time and written in chunks with a single
+executemany INSERT per chunk. Every chunk is committed together with the
+WeeklyReport rollups for the weeks it touched, so a failure part way through a
+file never leaves the rollups out of step with the rows.
+"""
+import csv
+import io
+from datetime import datetime, date
+from sqlalchemy import insert
+from app import db
+from cache import metrics_cache
+from models import Employee, Account, Expense
+from reporting import refresh_weekly_reports
+from database import run_write
+
+DEFAULT_CHUNK_SIZE = 5000
+
+# Error messages kept per import; the count of further errors is still reported
+MAX_REPORTED_ERRORS = 1000
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportResult:
+    """Outcome of one CSV import"""
+
+    def __init__(self):
+        self.inserted = 0
+        self.rejected = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def truncated(self):
+        return self.rejected > len(self.errors)
+
+
+def text_stream(stream):
+    """Wrap a binary upload as text, tolerating a UTF-8 byte order mark"""
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+
+class _DateParser:
+    """Parses YYYY-MM-DD strings, remembering each distinct value"""
+
+    def __init__(self, default):
+        self.default = default
+        self._seen = {}
+
+    def __call__(self, value):
+        value = (value or '').strip()
+        if not value:
+            return self.default
+        parsed = self._seen.get(value)
+        if parsed is None:
+            try:
+                parsed = datetime.strptime(value, '%Y-%m-%d').date()
+            except ValueError:
+                raise RowError(f'invalid date {value!r}, expected YYYY-MM-DD')
+            self._seen[value] = parsed
+        return parsed
+
+
+def _text(row, column, max_length, required=False):
+    value = (row.get(column) or '').strip()
+    if required and not value:
+        raise RowError(f'{column} is required')
+    if len(value) > max_length:
+        raise RowError(f'{column} is longer than {max_length} characters')
+    return value
+
+
+GOOD_VALUES = {'good', 'true', 'yes', '1'}
+PENDING_VALUES = {'pending', 'false', 'no', '0', ''}
+
+
+def _account_row(row, employee_ids, parse_date, position):
+    try:
+        employee_id = int((row.get('employee_id') or '').strip())
+    except ValueError:
+        raise RowError('employee_id must be a number')
+    if employee_id not in employee_ids:
+        raise RowError(f'unknown employee_id {employee_id}')
+
+    status = (row.get('status') or row.get('is_good') or '').strip().lower()
+    if status not in GOOD_VALUES and status not in PENDING_VALUES:
+        raise RowError(f'invalid status {status!r}, expected good or pending')
+
+    email = _text(row, 'client_email', 120)
+    return {
+        'employee_id': employee_id,
+        'account_number': _text(row, 'account_number', 50) or f'ACC{position:03d}',
+        'client_name': _text(row, 'client_name', 100, required=True),
+        'client_email': email or None,
+        'is_good': status in GOOD_VALUES,
+        'notes': (row.get('notes') or '').strip(),
+        'date_created': parse_date(row.get('date_created')),
+    }
+
+
+def _expense_row(row, parse_date):
+    try:
+        amount = float((row.get('amount') or '').strip())
+    except ValueError:
+        raise RowError('amount must be a number')
+    if amount < 0:
+        raise RowError('amount must not be negative')
+
+    return {
+        'description': _text(row, 'description', 200, required=True),
+        'amount': amount,
+        'category': _text(row, 'category', 50, required=True),
+        'date_incurred': parse_date(row.get('date_incurred')),
+    }
+
+
+def _write_chunk(model, rows, days):
+    db.session.execute(insert(model), rows)
+    refresh_weekly_reports(days)
+
+
+def _flush_chunk(model, rows, date_column, result):
+    if not rows:
+        return
+    created_at = datetime.utcnow()
+    for row in rows:
+        row['created_at'] = created_at
+
+    days = {row[date_column] for row in rows}
+    run_write(_write_chunk, model, rows, days)
+    metrics_cache.invalidate_weeks(days)
+
+    result.inserted += len(rows)
+
+
+def _run_import(stream, required_columns, build_row, model, date_column, chunk_size):
+    result = ImportResult()
+    reader = csv.DictReader(text_stream(stream))
+
+    missing = [column for column in required_columns if column not in (reader.fieldnames or [])]
+    if missing:
+        result.add_error(1, f"missing column(s): {', '.join(missing)}")
+        return result
+
+    chunk = []
+    try:
+        for row in reader:
+            try:
+                chunk.append(build_row(row, result.inserted + len(chunk) + 1))
+            except RowError as e:
+                result.add_error(reader.line_num, str(e))
+                continue
+
+            if len(chunk) >= chunk_size:
+                _flush_chunk(model, chunk, date_column, result)
+                chunk = []
+    except (csv.Error, UnicodeDecodeError) as e:
+        result.add_error(reader.line_num, f'unreadable CSV: {e}')
+
+    _flush_chunk(model, chunk, date_column, result)
+    return result
+
+
+def import_accounts_csv(stream, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Import accounts from CSV.
+
+    Columns: employee_id, client_name (required); account_number,
+    client_email, status (good/pending), notes, date_created (optional).
+    """
+    employee_ids = {employee_id for (employee_id,) in db.session.query(Employee.id)}
+    parse_date = _DateParser(date.today())
+
+    def build_row(row, position):
+        return _account_row(row, employee_ids, parse_date, position)
+
+    return _run_import(stream, ('employee_id', 'client_name'), build_row,
+                       Account, 'date_created', chunk_size)
+
+
+def import_expenses_csv(stream, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Import expenses from CSV.
+
+    Columns: description, amount, category (required); date_incurred
+    (optional).
+    """
+    parse_date = _DateParser(date.today())
+
+    def build_row(row, position):
+        return _expense_row(row, parse_date)
+
+    return _run_import(stream, ('description', 'amount', 'category'), build_row,
+                       Expense, 'date_incurred', chunk_size)
@@ -0,0 +1,213 @@
+"""Per-request SQL and latency instrumentation.
+
+Hooks SQLAlchemy cursor events and Flask request/template signals to record,
+per endpoint, the total latency, the number of SQL statements, the time spent
+in SQL and the time spent rendering templates. The figures are exposed as
+Prometheus histograms on ``/metrics`` and as a ``Server-Timing`` header on
+every response. Statements slower than SLOW_QUERY_MS are logged.
+
+Metrics are kept per process; with several gunicorn workers each scrape sees
+the worker that answered it.
+"""
+import bisect
+import logging
+import threading
+import time
+from flask import g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+slow_query_logger = logging.getLogger('instrumentation.slow_query')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, rendered in Prometheus text format"""
+
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted(self._series.items())
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in series]
+
+        for label_values, counts, total, count in series:
+            labels = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values))
+            prefix = labels + ',' if labels else ''
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return '\n'.join(lines)
+
+
+class Counter:
+    """Labelled monotonic counter"""
+
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            labels = ','.join(f'{name}="{_escape(v)}"' for name, v in zip(self.labels, label_values))
+            lines.append(f'{self.name}{{{labels}}} {value}')
+        return '\n'.join(lines)
+
+
+request_latency = Histogram('http_request_duration_seconds', 'Total request latency.',
+                            ('endpoint', 'method', 'status'), LATENCY_BUCKETS)
+request_queries = Histogram('http_request_sql_queries', 'SQL statements executed per request.',
+                            ('endpoint',), QUERY_COUNT_BUCKETS)
+request_sql_time = Histogram('http_request_sql_duration_seconds', 'Time spent in SQL per request.',
+                             ('endpoint',), LATENCY_BUCKETS)
+request_render_time = Histogram('http_request_render_duration_seconds',
+                                'Time spent rendering templates per request.',
+                                ('endpoint',), LATENCY_BUCKETS)
+slow_queries = Counter('sql_slow_queries_total', 'SQL statements slower than SLOW_QUERY_MS.',
+                       ('endpoint',))
+
+ALL_METRICS = (request_latency, request_queries, request_sql_time, request_render_time, slow_queries)
+
+
+def _stats():
+    """The current request's counters, or None outside instrumented requests"""
+    if not has_request_context():
+        return None
+    return g.get('_instrumentation')
+
+
+# The start time lives on the statement's execution context, which is dropped
+# with it, so a statement that raises leaves nothing behind on the connection
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._instrumentation_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_instrumentation_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+
+    stats = _stats()
+    if stats is None:
+        return
+    stats['queries'] += 1
+    stats['sql'] += elapsed
+
+    if elapsed >= stats['slow_query_seconds']:
+        endpoint = request.endpoint or 'unmatched'
+        slow_queries.inc(endpoint)
+        slow_query_logger.warning('Slow query (%.1f ms) on %s: %s',
+                                  elapsed * 1000, endpoint, ' '.join(statement.split())[:500])
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _stats()
+    if stats is not None:
+        stats['render_started'].append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    stats = _stats()
+    if stats is not None and stats['render_started']:
+        stats['render'] += time.perf_counter() - stats['render_started'].pop()
+
+
+_engine_hooks_installed = False
+
+
+def init_app(app):
+    """Install the hooks and the /metrics endpoint on app"""
+    global _engine_hooks_installed
+
+    app.config.setdefault('INSTRUMENTATION_ENABLED', True)
+    app.config.setdefault('SLOW_QUERY_MS', 200)
+    if not app.config['INSTRUMENTATION_ENABLED']:
+        return
+
+    if not _engine_hooks_installed:
+        # Listening on the Engine class covers engines created later
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _engine_hooks_installed = True
+
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    slow_query_seconds = app.config['SLOW_QUERY_MS'] / 1000.0
+
+    @app.before_request
+    def start_request_timer():
+        g._instrumentation = {
+            'started': time.perf_counter(),
+            'queries': 0,
+            'sql': 0.0,
+            'render': 0.0,
+            'render_started': [],
+            'slow_query_seconds': slow_query_seconds,
+        }
+
+    @app.after_request
+    def record_request(response):
+        stats = g.pop('_instrumentation', None)
+        if stats is None:
+            return response
+
+        total = time.perf_counter() - stats['started']
+        endpoint = request.endpoint or 'unmatched'
+        request_latency.observe(total, endpoint, request.method, str(response.status_code))
+        request_queries.observe(stats['queries'], endpoint)
+        request_sql_time.observe(stats['sql'], endpoint)
+        request_render_time.observe(stats['render'], endpoint)
+
+        response.headers['Server-Timing'] = (
+            f'sql;dur={stats["sql"] * 1000:.1f};desc="{stats["queries"]} queries", '
+            f'render;dur={stats["render"] * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}'
+        )
+        return response
+
+    def metrics():
+        """Prometheus scrape endpoint"""
+        body = '\n'.join(metric.render() for metric in ALL_METRICS) + '\n'
+        return app.response_class(body, mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
@@ -0,0 +1,141 @@
+"""Local background jobs for slow reports, exports and rollup rebuilds.
+
+Jobs run on a thread pool inside each worker, so no broker is needed. Job
+records are kept in the metrics cache backend for JOB_RESULT_TTL seconds; with
+a shared backend (file:// or redis://) any worker can answer a status poll for
+a job that another worker is running.
+"""
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from app import db
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED = 'finished'
+FAILED = 'failed'
+
+
+class JobRunner:
+    """Thread pool plus job bookkeeping in the cache backend"""
+
+    def __init__(self):
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('JOB_WORKERS', 2)
+        app.config.setdefault('JOB_RESULT_TTL', 3600)
+        app.extensions['job_runner'] = self
+
+    def _get_executor(self, workers):
+        # Created on first use so forked workers never inherit a parent's threads
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    @staticmethod
+    def _key(job_id):
+        return f'job:{job_id}'
+
+    def _save(self, backend, job, ttl):
+        backend.set(self._key(job['id']), job, ttl)
+
+    def submit(self, name, func, *args, **kwargs):
+        """Queue func(*args, **kwargs) in an app context and return the job id"""
+        return self._submit(None, name, func, args, kwargs)
+
+    def _submit(self, key, name, func, args, kwargs):
+        app = current_app._get_current_object()
+        backend = app.extensions['metrics_cache']
+        ttl = app.config['JOB_RESULT_TTL']
+
+        job = {
+            'id': uuid.uuid4().hex,
+            'name': name,
+            'key': key,
+            'status': QUEUED,
+            'submitted_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'error': None,
+        }
+        self._save(backend, job, ttl)
+
+        def run():
+            with app.app_context():
+                job['status'] = RUNNING
+                job['started_at'] = time.time()
+                self._save(backend, job, ttl)
+                try:
+                    job['result'] = func(*args, **kwargs)
+                    job['status'] = FINISHED
+                except Exception as e:
+                    app.logger.exception(f"Job {name} ({job['id']}) failed")
+                    db.session.rollback()
+                    job['error'] = str(e)
+                    job['status'] = FAILED
+                finally:
+                    job['finished_at'] = time.time()
+                    self._save(backend, job, ttl)
+                    db.session.remove()
+
+        self._get_executor(app.config['JOB_WORKERS']).submit(run)
+        return job['id']
+
+    def get(self, job_id):
+        """The job record, or None if unknown or past its retention"""
+        return current_app.extensions['metrics_cache'].get(self._key(job_id))
+
+    def find(self, key, reuse_finished=True):
+        """Job id registered under a deduplication key, if still worth reusing.
+
+        Queued and running jobs always are; a finished one only with
+        reuse_finished, and a failed one never.
+        """
+        job_id = current_app.extensions['metrics_cache'].get(f'job-key:{key}')
+        job = self.get(job_id) if job_id else None
+        if job is None or job['status'] == FAILED:
+            return None
+        if job['status'] == FINISHED and not reuse_finished:
+            return None
+        return job_id
+
+    def submit_once(self, key, name, func, *args, reuse_finished=True, **kwargs):
+        """Like submit, but reuse a job already submitted under key.
+
+        Pass reuse_finished=False for jobs run for their effect rather than
+        their result, so a finished one is run again. The key is kept in the
+        job record, so a job id taken from a request can be checked against
+        the key that request would use.
+        """
+        job_id = self.find(key, reuse_finished)
+        if job_id is None:
+            job_id = self._submit(key, name, func, args, kwargs)
+            current_app.extensions['metrics_cache'].set(
+                f'job-key:{key}', job_id, current_app.config['JOB_RESULT_TTL'])
+        return job_id
+
+
+def remove_expired_files(directory, ttl):
+    """Delete job output files older than the result retention"""
+    if not os.path.isdir(directory):
+        return
+    cutoff = time.time() - ttl
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+job_runner = JobRunner()
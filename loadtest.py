@@ -0,0 +1,170 @@
+"""HTTP load test of the development server against gunicorn.
+
+Starts each server on a local port against the database in DATABASE_URL,
+drives the same routes from --clients threads over keep-alive connections for
+--duration seconds, stops it again and reports throughput and latency:
+
+    python loadtest.py --clients 16 --duration 20
+    python loadtest.py --server gunicorn --workers 4 --threads 8
+
+The dev server is started exactly as ``python main.py`` starts it. Client
+threads share the machine with the server, so run this on a box with spare
+cores for figures that reflect the server alone.
+"""
+import argparse
+import http.client
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from benchmark import percentile
+
+DEFAULT_ROUTES = ['/', '/accounts', '/reports', '/api/dashboard-data']
+
+SERVERS = {
+    'dev': [sys.executable, 'main.py'],
+    'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'],
+}
+
+
+def start_server(name, port, workers=None, threads=None):
+    """Start a server in its own process group and wait until it answers"""
+    env = dict(os.environ, PORT=str(port), BIND=f'127.0.0.1:{port}', ACCESS_LOG='',
+               LOG_LEVEL='WARNING')
+    if workers:
+        env['WEB_CONCURRENCY'] = str(workers)
+    if threads:
+        env['WEB_THREADS'] = str(threads)
+
+    process = subprocess.Popen(SERVERS[name], env=env, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{name} server exited with status {process.returncode}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/api/dashboard-data')
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f'{name} server did not start on port {port}')
+
+
+def stop_server(process):
+    # The dev server's reloader runs the app in a child, so stop the whole group
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except ProcessLookupError:
+        pass
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def _get(connection, route):
+    try:
+        connection.request('GET', route)
+        response = connection.getresponse()
+    except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+        # A recycled worker closes its idle keep-alive connections; like a
+        # browser, retry the GET once on a new connection
+        connection.close()
+        connection.request('GET', route)
+        response = connection.getresponse()
+    response.read()
+    return response
+
+
+def _client(port, routes, offset, deadline, results, lock):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    timings = []
+    errors = 0
+    i = offset
+    while time.perf_counter() < deadline:
+        route = routes[i % len(routes)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            response = _get(connection, route)
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            continue
+        if response.status >= 400:
+            errors += 1
+        else:
+            timings.append((time.perf_counter() - started) * 1000)
+    connection.close()
+    with lock:
+        results.append((timings, errors))
+
+
+def run_load(port, routes, clients, duration):
+    """Drive routes from client threads for duration seconds"""
+    results = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=_client, args=(port, routes, i, deadline, results, lock))
+               for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    timings = [timing for client_timings, _ in results for timing in client_timings]
+    return {
+        'requests': len(timings),
+        'errors': sum(errors for _, errors in results),
+        'rps': round(len(timings) / elapsed, 1),
+        'p50_ms': round(percentile(timings, 50), 2) if timings else None,
+        'p99_ms': round(percentile(timings, 99), 2) if timings else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('routes', nargs='*', help='Routes to request in turn (default: dashboard pages)')
+    parser.add_argument('--server', choices=['dev', 'gunicorn', 'both'], default='both')
+    parser.add_argument('--clients', type=int, default=16, help='Concurrent keep-alive connections')
+    parser.add_argument('--duration', type=float, default=15, help='Seconds of load per server')
+    parser.add_argument('--warmup', type=float, default=2, help='Seconds of untimed load first')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--workers', type=int, help='Gunicorn workers (default: from gunicorn.conf.py)')
+    parser.add_argument('--threads', type=int, help='Gunicorn threads per worker')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args(argv)
+
+    routes = args.routes or DEFAULT_ROUTES
+    servers = ['dev', 'gunicorn'] if args.server == 'both' else [args.server]
+    results = {}
+    for name in servers:
+        process = start_server(name, args.port, args.workers, args.threads)
+        try:
+            if args.warmup:
+                run_load(args.port, routes, args.clients, args.warmup)
+            results[name] = run_load(args.port, routes, args.clients, args.duration)
+        finally:
+            stop_server(process)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'server':<10} {'req/s':>9} {'requests':>9} {'errors':>7} {'p50 ms':>9} {'p99 ms':>9}")
+        for name, stats in results.items():
+            print(f"{name:<10} {stats['rps']:>9.1f} {stats['requests']:>9} {stats['errors']:>7}"
+                  f" {stats['p50_ms'] or 0:>9.2f} {stats['p99_ms'] or 0:>9.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,12 @@
-from app import app
+import os
+from app import create_app
+
+app = create_app()
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Development server only; production runs `gunicorn -c gunicorn.conf.py`.
+    # It brings its database up to date; deployments run `flask init-db`
+    import migrations
+    with app.app_context():
+        migrations.init_db()
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=True)
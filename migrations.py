@@ -0,0 +1,169 @@
+"""Versioned, in-place schema upgrades.
+
+``db.create_all()`` only creates missing tables; it never touches tables that
+already exist in ``instance/*.db``. Each migration below brings an older
+database up to the current models and is recorded in ``schema_version`` so it
+runs exactly once. The app never does this on startup; run ``flask init-db``
+when deploying.
+"""
+from app import db
+from models import (Employee, Account, Expense, WeeklyReport, SchemaVersion,
+                    ArchivedAccount, ArchivedExpense, ArchiveState)
+from datetime import date, timedelta, datetime
+from sqlalchemy import func, text
+
+
+def _create_indexes(connection, *models):
+    for model in models:
+        for index in model.__table__.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def _add_hot_filter_indexes(connection):
+    """Indexes for the dashboard, report and list filters"""
+    # Collapse duplicate rollups before the unique week_start index goes on
+    connection.execute(text(
+        'DELETE FROM weekly_report WHERE id NOT IN '
+        '(SELECT MAX(id) FROM weekly_report GROUP BY week_start)'
+    ))
+    _create_indexes(connection, Employee, Account, Expense, WeeklyReport)
+
+
+def _add_account_search_index(connection):
+    """FTS5 index over accounts; a no-op where FTS5 is unavailable"""
+    import search
+    search.create_fts_index(connection)
+
+
+def _add_archive_tables(connection):
+    """Cold storage for archived accounts and expenses, and the archive watermark"""
+    for model in (ArchivedAccount, ArchivedExpense, ArchiveState):
+        model.__table__.create(connection, checkfirst=True)
+
+
+def _add_change_log(connection):
+    """Change log table and the triggers that fill it; a no-op except on SQLite"""
+    import changelog
+    changelog.create_change_log(connection)
+
+
+# (version, description, upgrade function) in the order they must run
+MIGRATIONS = [
+    (1, 'Add indexes for hot filter columns', _add_hot_filter_indexes),
+    (2, 'Add full-text search index for accounts', _add_account_search_index),
+    (3, 'Add archive tables for old accounts and expenses', _add_archive_tables),
+    (4, 'Add change log for the sync feed', _add_change_log),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(connection):
+    """Return the schema version recorded in the database (0 if none)"""
+    table = SchemaVersion.__table__
+    if not db.inspect(connection).has_table(table.name):
+        return 0
+    return connection.execute(db.select(func.max(table.c.version))).scalar() or 0
+
+
+def upgrade(engine=None):
+    """Apply every pending migration, each in its own transaction.
+
+    Returns the list of versions applied.
+    """
+    engine = engine or db.engine
+    SchemaVersion.__table__.create(engine, checkfirst=True)
+
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        with engine.begin() as connection:
+            if current_version(connection) >= version:
+                continue
+            migrate(connection)
+            connection.execute(SchemaVersion.__table__.insert().values(
+                version=version, applied_at=datetime.utcnow()))
+        applied.append((version, description))
+
+    return applied
+
+
+def pending_migrations(engine=None):
+    """Migrations the database has not applied yet (all of them for an empty database)"""
+    engine = engine or db.engine
+    with engine.connect() as connection:
+        version = current_version(connection)
+    return [(number, description) for number, description, _ in MIGRATIONS if number > version]
+
+
+def init_db(engine=None):
+    """Create any missing tables and apply pending migrations.
+
+    A database already at SCHEMA_VERSION is left alone without reflecting
+    every table. Returns the list of versions applied.
+    """
+    engine = engine or db.engine
+    if not pending_migrations(engine):
+        return []
+
+    db.metadata.create_all(engine)
+    return upgrade(engine)
+
+
+# --- Query plan checks -----------------------------------------------------
+
+def hot_queries():
+    """Representative statements for every hot path, keyed by name"""
+    today = date.today()
+    week_start = today - timedelta(days=today.weekday())
+    week_end = week_start + timedelta(days=6)
+    oldest = week_start - timedelta(weeks=11)
+
+    return {
+        'weekly account totals': db.select(
+            func.count(Account.id), func.sum(Account.is_good)
+        ).where(Account.date_created >= oldest, Account.date_created <= week_end),
+        'weekly expense totals': db.select(func.sum(Expense.amount)).where(
+            Expense.date_incurred >= oldest, Expense.date_incurred <= week_end),
+        'employee weekly accounts': db.select(Account).where(
+            Account.employee_id == 1,
+            Account.date_created >= week_start,
+            Account.date_created <= week_end),
+        'recent accounts': db.select(Account).order_by(Account.created_at.desc()).limit(5),
+        'recent expenses': db.select(Expense).order_by(Expense.created_at.desc()).limit(5),
+        'expenses by category': db.select(Expense).where(
+            Expense.category == 'Office').order_by(Expense.created_at.desc()).limit(20),
+        'active employees': db.select(Employee).where(Employee.is_active.is_(True)),
+        'weekly report lookup': db.select(WeeklyReport).where(
+            WeeklyReport.week_start.in_([week_start, oldest])),
+    }
+
+
+def _uses_index(dialect, plan):
+    if dialect == 'sqlite':
+        # "SCAN account" without an index is a full table scan
+        return not any(line.startswith('SCAN') and 'INDEX' not in line for line in plan)
+    if dialect == 'postgresql':
+        return not any('Seq Scan' in line for line in plan)
+    return True
+
+
+def explain_hot_queries():
+    """Run EXPLAIN on every hot query.
+
+    Returns (name, plan lines, uses_index) tuples. Only SQLite and PostgreSQL
+    plans are checked; other backends always report uses_index=True.
+    """
+    dialect = db.engine.dialect.name
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+
+    results = []
+    with db.engine.connect() as connection:
+        for name, statement in hot_queries().items():
+            compiled = statement.compile(dialect=db.engine.dialect,
+                                         compile_kwargs={'literal_binds': True})
+            rows = connection.exec_driver_sql(prefix + str(compiled)).all()
+            # SQLite returns (id, parent, notused, detail); others a single column
+            plan = [str(row[-1]) for row in rows]
+            results.append((name, plan, _uses_index(dialect, plan)))
+
+    return results
@@ -1,8 +1,16 @@
 from app import db
 from datetime import datetime, date, timedelta
-from sqlalchemy import func
+from sqlalchemy import func, case, and_, union_all
+
+# Business rates in KSH
+REVENUE_PER_GOOD_ACCOUNT = 1400
+PAYMENT_PER_ACCOUNT = 500
 
 class Employee(db.Model):
+    __table_args__ = (
+        db.Index('ix_employee_is_active', 'is_active'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -18,8 +26,8 @@ class Employee(db.Model):
     def __repr__(self):
         return f'<Employee {self.name}>'
     
-    def get_weekly_accounts(self, week_start=None):
-        """Get accounts for a specific week"""
+    def _weekly_accounts_query(self, week_start=None):
+        """Query for this employee's accounts in a specific week"""
         if week_start is None:
             # Get current week
             today = date.today()
@@ -31,19 +39,94 @@ class Employee(db.Model):
             Account.employee_id == self.id,
             Account.date_created >= week_start,
             Account.date_created <= week_end
-        ).all()
+        )
+    
+    def get_weekly_accounts(self, week_start=None):
+        """Get accounts for a specific week"""
+        return self._weekly_accounts_query(week_start).all()
     
     def get_total_payment(self, week_start=None):
         """Calculate total payment for employee (500 KSH per account)"""
-        accounts = self.get_weekly_accounts(week_start)
-        return len(accounts) * 500
+        return self._weekly_accounts_query(week_start).count() * PAYMENT_PER_ACCOUNT
     
     def get_good_accounts_count(self, week_start=None):
         """Get count of good accounts for the week"""
-        accounts = self.get_weekly_accounts(week_start)
-        return sum(1 for account in accounts if account.is_good)
+        return self._weekly_accounts_query(week_start).filter(Account.is_good.is_(True)).count()
+    
+    # Sort keys accepted by weekly_performance
+    PERFORMANCE_SORT_KEYS = ('id', 'name', 'total_accounts', 'good_accounts', 'payment')
+    
+    @classmethod
+    def weekly_performance(cls, week_start=None, sort='id', descending=False, page=None, per_page=50):
+        """Account totals, good counts and payment for every active employee.
+        
+        Runs a single grouped query for the whole roster. Results can be ranked
+        by any of PERFORMANCE_SORT_KEYS and, when page is given, limited to one
+        page of per_page rows.
+        """
+        if week_start is None:
+            today = date.today()
+            week_start = today - timedelta(days=today.weekday())
+        
+        week_end = week_start + timedelta(days=6)
+        
+        # Archived weeks are read from both tables; others only from the live one
+        accounts = Account.__table__
+        archived_before = ArchiveState.archived_before_date()
+        if archived_before is not None and week_start < archived_before:
+            columns = ('id', 'employee_id', 'is_good', 'date_created')
+            accounts = union_all(*[
+                db.select(*[model.__table__.c[name] for name in columns]).where(
+                    model.date_created >= week_start, model.date_created <= week_end)
+                for model in (Account, ArchivedAccount)
+            ]).subquery('accounts')
+        
+        total_accounts = func.count(accounts.c.id)
+        good_accounts = func.coalesce(func.sum(case((accounts.c.is_good.is_(True), 1), else_=0)), 0)
+        
+        sort_columns = {
+            'id': cls.id,
+            'name': cls.name,
+            'total_accounts': total_accounts,
+            'good_accounts': good_accounts,
+            'payment': total_accounts,
+        }
+        if sort not in sort_columns:
+            raise ValueError(f'Unknown sort key: {sort}')
+        
+        order = sort_columns[sort].desc() if descending else sort_columns[sort].asc()
+        
+        query = db.session.query(cls, total_accounts, good_accounts).outerjoin(
+            accounts, and_(
+                accounts.c.employee_id == cls.id,
+                accounts.c.date_created >= week_start,
+                accounts.c.date_created <= week_end
+            )
+        ).filter(
+            cls.is_active.is_(True)
+        ).group_by(cls.id).order_by(order, cls.id)
+        
+        if page is not None:
+            query = query.limit(per_page).offset((page - 1) * per_page)
+        
+        return [{
+            'employee': employee,
+            'total_accounts': total,
+            'good_accounts': good,
+            'success_rate': good / total * 100 if total else 0,
+            'payment': total * PAYMENT_PER_ACCOUNT
+        } for employee, total, good in query.all()]
 
 class Account(db.Model):
+    __table_args__ = (
+        # Per-employee weekly lookups
+        db.Index('ix_account_employee_date', 'employee_id', 'date_created'),
+        # Weekly aggregates count good accounts straight from the index
+        db.Index('ix_account_date_good', 'date_created', 'is_good'),
+        # Newest-first listings
+        db.Index('ix_account_created_at', 'created_at', 'id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
     account_number = db.Column(db.String(50), nullable=False)
@@ -58,6 +141,13 @@ class Account(db.Model):
         return f'<Account {self.account_number}>'
 
 class Expense(db.Model):
+    __table_args__ = (
+        # Weekly sums are answered from the index alone
+        db.Index('ix_expense_date_amount', 'date_incurred', 'amount'),
+        db.Index('ix_expense_category_created', 'category', 'created_at'),
+        db.Index('ix_expense_created_at', 'created_at', 'id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     description = db.Column(db.String(200), nullable=False)
     amount = db.Column(db.Float, nullable=False)
@@ -69,6 +159,10 @@ class Expense(db.Model):
         return f'<Expense {self.description}: {self.amount} KSH>'
 
 class WeeklyReport(db.Model):
+    __table_args__ = (
+        db.Index('ix_weekly_report_week_start', 'week_start', unique=True),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     week_start = db.Column(db.Date, nullable=False)
     week_end = db.Column(db.Date, nullable=False)
@@ -82,3 +176,90 @@ class WeeklyReport(db.Model):
     
     def __repr__(self):
         return f'<WeeklyReport {self.week_start} - {self.week_end}>'
+
+class ArchivedAccount(db.Model):
+    """Account moved out of the live table by archive.py, keeping its id"""
+    __table_args__ = (
+        db.Index('ix_archived_account_employee_date', 'employee_id', 'date_created'),
+        db.Index('ix_archived_account_date_good', 'date_created', 'is_good'),
+        db.Index('ix_archived_account_created_at', 'created_at', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
+    account_number = db.Column(db.String(50), nullable=False)
+    client_name = db.Column(db.String(100), nullable=False)
+    client_email = db.Column(db.String(120))
+    is_good = db.Column(db.Boolean, default=True)
+    notes = db.Column(db.Text)
+    date_created = db.Column(db.Date)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    employee = db.relationship('Employee')
+    
+    def __repr__(self):
+        return f'<ArchivedAccount {self.account_number}>'
+
+class ArchivedExpense(db.Model):
+    """Expense moved out of the live table by archive.py, keeping its id"""
+    __table_args__ = (
+        db.Index('ix_archived_expense_date_amount', 'date_incurred', 'amount'),
+        db.Index('ix_archived_expense_category_created', 'category', 'created_at'),
+        db.Index('ix_archived_expense_created_at', 'created_at', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    date_incurred = db.Column(db.Date)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ArchivedExpense {self.description}: {self.amount} KSH>'
+
+class ArchiveState(db.Model):
+    """Single-row table holding the archive watermark.
+    
+    Rows dated before archived_before may be in the archive tables rather
+    than the live ones; nothing on or after it ever is.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    archived_before = db.Column(db.Date, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @classmethod
+    def archived_before_date(cls):
+        """The watermark, or None if nothing has been archived"""
+        return db.session.query(func.max(cls.archived_before)).scalar()
+    
+    def __repr__(self):
+        return f'<ArchiveState {self.archived_before}>'
+
+class ChangeLog(db.Model):
+    """Append-only log of employee, account and expense writes (see changelog.py).
+
+    Rows are written by database triggers in the writer's own transaction;
+    id is the cursor of the change feed and is never reused.
+    """
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)  # employee, account or expense
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(20), nullable=False)  # insert, update or deactivate
+    changed_at = db.Column(db.DateTime, nullable=False, server_default=func.current_timestamp())
+
+    def __repr__(self):
+        return f'<ChangeLog {self.id}: {self.op} {self.entity} {self.entity_id}>'
+
+class SchemaVersion(db.Model):
+    """Single-row table recording the last migration applied (see migrations.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SchemaVersion {self.version}>'
@@ -0,0 +1,65 @@
+"""In-process change notifications for the live dashboard stream.
+
+Write routes publish an event after they commit, and every ``/api/stream``
+connection in the worker waits on the same condition variable, so one commit
+wakes all connected dashboards without any of them polling the database.
+
+Events only reach clients connected to the worker that handled the write.
+Streams also watch the metrics cache version, which is shared when the cache
+backend is, and send a fresh snapshot when it moves; that covers writes made
+by other workers, imports and rollup rebuilds.
+"""
+import threading
+from collections import deque
+
+
+class ChangeNotifier:
+    """Broadcasts events to every waiting stream in the process"""
+
+    def __init__(self, history=100):
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=history)
+        self._last_id = 0
+        self._clients = 0
+
+    def init_app(self, app):
+        app.config.setdefault('STREAM_HEARTBEAT', 15)
+        app.config.setdefault('STREAM_MAX_AGE', 300)
+        app.config.setdefault('STREAM_MAX_CLIENTS', 50)
+        app.extensions['change_notifier'] = self
+
+    @property
+    def last_id(self):
+        with self._condition:
+            return self._last_id
+
+    def publish(self, event, data):
+        """Record an event and wake every waiting stream"""
+        with self._condition:
+            self._last_id += 1
+            self._events.append((self._last_id, event, data))
+            self._condition.notify_all()
+
+    def wait(self, after_id, timeout):
+        """Events newer than after_id, blocking up to timeout seconds for one.
+
+        Events that have already dropped out of the history are skipped.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._last_id > after_id, timeout)
+            return [entry for entry in self._events if entry[0] > after_id]
+
+    def connect(self, max_clients):
+        """Reserve a stream slot; False when the worker already has max_clients"""
+        with self._condition:
+            if self._clients >= max_clients:
+                return False
+            self._clients += 1
+            return True
+
+    def disconnect(self):
+        with self._condition:
+            self._clients -= 1
+
+
+change_notifier = ChangeNotifier()
@@ -0,0 +1,105 @@
+import base64
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(created_at, row_id):
+    """Opaque URL-safe cursor for a (created_at, id) position"""
+    raw = f'{created_at.isoformat()}|{row_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the (created_at, id) position of a cursor, or None if it is malformed"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.split('|', 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def encode_rank_cursor(rank, row_id):
+    """Opaque cursor for a (search rank, id) position"""
+    raw = f'{rank!r}|{row_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_rank_cursor(cursor):
+    """Return the (rank, id) position of a cursor, or None if it is malformed"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        rank, row_id = raw.split('|', 1)
+        return float(rank), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    """One page of newest-first rows with cursors to its neighbours"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        # Only counted when explicitly requested
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def keyset_paginate(query, model, after=None, before=None, per_page=20, with_total=False):
+    """Paginate query newest first on (created_at, id) without OFFSET.
+
+    ``after`` returns the page following that cursor and ``before`` the page
+    preceding it. The total row count is only computed when with_total is set,
+    since it costs a full COUNT(*).
+    """
+    created_at, row_id = model.created_at, model.id
+    total = query.order_by(None).count() if with_total else None
+
+    before_position = decode_cursor(before)
+    after_position = decode_cursor(after)
+
+    if before_position is not None:
+        position_at, position_id = before_position
+        rows = query.filter(or_(
+            created_at > position_at,
+            and_(created_at == position_at, row_id > position_id)
+        )).order_by(created_at.asc(), row_id.asc()).limit(per_page + 1).all()
+
+        has_more = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        return KeysetPage(
+            items,
+            next_cursor=encode_cursor(items[-1].created_at, items[-1].id) if items else None,
+            prev_cursor=encode_cursor(items[0].created_at, items[0].id) if has_more else None,
+            total=total
+        )
+
+    if after_position is not None:
+        position_at, position_id = after_position
+        query = query.filter(or_(
+            created_at < position_at,
+            and_(created_at == position_at, row_id < position_id)
+        ))
+
+    rows = query.order_by(created_at.desc(), row_id.desc()).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+    return KeysetPage(
+        items,
+        next_cursor=encode_cursor(items[-1].created_at, items[-1].id) if has_more else None,
+        prev_cursor=encode_cursor(items[0].created_at, items[0].id) if after_position and items else None,
+        total=total
+    )
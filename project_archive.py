@@ -0,0 +1,181 @@
+"""Cached ZIP of the project source for /download-project.
+
+The archive is built once per content fingerprint of the tree, leaving out
+the instance folder, and kept under ``instance/artifacts``; requests reuse it
+until a file changes. Older archives are removed as soon as a newer one has
+been written.
+"""
+import os
+import re
+import time
+import hashlib
+import tempfile
+import threading
+import zipfile
+
+ARCHIVE_NAME = 'company-management-system.zip'
+
+# Files and directories to exclude from the ZIP
+EXCLUDE_PATTERNS = {
+    '.git', '__pycache__', '.pytest_cache', 'node_modules',
+    '.env', 'venv', '.venv', '.pythonlibs', '.upm', '.cache',
+    '*.pyc', '*.pyo', '*.pyd', '.DS_Store', '.replit.nix',
+    # Built by flask build-assets
+    'dist',
+    # Live SQLite databases, wherever DATABASE_URL points
+    '*.db', '*.db-wal', '*.db-shm', '*.db-journal',
+}
+
+# Hidden entries are skipped, except for these
+ALLOWED_HIDDEN = {'.replit'}
+
+# One regex instead of scanning every pattern for every file
+_EXCLUDED_FILE = re.compile(
+    '(?:%s)\\Z' % '|'.join(re.escape(pattern.replace('*', '')) for pattern in sorted(EXCLUDE_PATTERNS))
+)
+
+# Reuse a computed fingerprint for this many seconds
+FINGERPRINT_TTL = 5
+
+INSTALL_SCRIPT_WINDOWS = """@echo off
+echo Setting up Company Management System...
+echo.
+echo Creating virtual environment...
+python -m venv venv
+echo.
+echo Activating virtual environment...
+call venv\\Scripts\\activate
+echo.
+echo Installing dependencies...
+pip install flask flask-sqlalchemy psycopg2-binary gunicorn werkzeug email-validator sqlalchemy
+echo.
+echo Setup complete!
+echo.
+echo To run the application:
+echo 1. Run: venv\\Scripts\\activate
+echo 2. Run: python main.py
+echo 3. Open browser to http://localhost:5000
+echo.
+pause
+"""
+
+INSTALL_SCRIPT_UNIX = """#!/bin/bash
+echo "Setting up Company Management System..."
+echo
+echo "Creating virtual environment..."
+python3 -m venv venv
+echo
+echo "Activating virtual environment..."
+source venv/bin/activate
+echo
+echo "Installing dependencies..."
+pip install flask flask-sqlalchemy psycopg2-binary gunicorn werkzeug email-validator sqlalchemy
+echo
+echo "Setup complete!"
+echo
+echo "To run the application:"
+echo "1. Run: source venv/bin/activate"
+echo "2. Run: python main.py"
+echo "3. Open browser to http://localhost:5000"
+echo
+echo "In production, run: flask init-db && gunicorn -c gunicorn.conf.py"
+echo
+"""
+
+_build_lock = threading.Lock()
+_fingerprint_cache = {}
+
+
+def _excluded_dir(name):
+    return name in EXCLUDE_PATTERNS or name.startswith('.')
+
+
+def _excluded_file(name):
+    return bool(_EXCLUDED_FILE.search(name)) or (name.startswith('.') and name not in ALLOWED_HIDDEN)
+
+
+def iter_project_files(project_root, skip_dirs=()):
+    """Yield (absolute path, archive path) for every file that belongs in the ZIP"""
+    skip_dirs = {os.path.abspath(path) for path in skip_dirs}
+    for root, dirs, files in os.walk(project_root):
+        dirs[:] = sorted(d for d in dirs
+                         if not _excluded_dir(d) and os.path.join(root, d) not in skip_dirs)
+        for name in sorted(files):
+            if _excluded_file(name):
+                continue
+            file_path = os.path.join(root, name)
+            yield file_path, os.path.relpath(file_path, project_root)
+
+
+def fingerprint(project_root, skip_dirs=()):
+    """Hash of every included file's path, size and mtime"""
+    cached = _fingerprint_cache.get(project_root)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    digest = hashlib.sha1()
+    for file_path, arc_path in iter_project_files(project_root, skip_dirs):
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            continue
+        digest.update(f'{arc_path}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode())
+
+    value = digest.hexdigest()
+    _fingerprint_cache[project_root] = (time.monotonic() + FINGERPRINT_TTL, value)
+    return value
+
+
+def _write_archive(path, project_root, skip_dirs):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for file_path, arc_path in iter_project_files(project_root, skip_dirs):
+            try:
+                zipf.write(file_path, arc_path)
+            except FileNotFoundError:
+                # Removed while we were walking; the next fingerprint will differ
+                continue
+
+        zipf.writestr('setup_windows.bat', INSTALL_SCRIPT_WINDOWS)
+        zipf.writestr('setup_unix.sh', INSTALL_SCRIPT_UNIX)
+
+
+def _remove_stale(cache_dir, keep):
+    for name in os.listdir(cache_dir):
+        if name.startswith('project-') and name.endswith('.zip') and name != keep:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+
+def get_archive(project_root, cache_dir, skip_dirs=()):
+    """Return (path, fingerprint) of an up-to-date project archive.
+
+    Directories in skip_dirs, like the instance folder with its database,
+    cache and export files, are left out of both the ZIP and the fingerprint.
+    The archive is rebuilt only when the fingerprint changes. Concurrent
+    requests in a worker wait for a single build; separate workers write to
+    temp files and rename, so a partial archive is never served.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    skip_dirs = (cache_dir, *skip_dirs)
+    current = fingerprint(project_root, skip_dirs)
+    name = f'project-{current}.zip'
+    path = os.path.join(cache_dir, name)
+
+    if os.path.exists(path):
+        return path, current
+
+    with _build_lock:
+        if not os.path.exists(path):
+            fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            os.close(fd)
+            try:
+                _write_archive(temp_path, project_root, skip_dirs)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+            _remove_stale(cache_dir, keep=name)
+
+    return path, current
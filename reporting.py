@@ -0,0 +1,438 @@
+from app import db
+from cache import metrics_cache
+from database import run_write
+from models import (Account, Expense, WeeklyReport, ArchivedAccount, ArchivedExpense, ArchiveState,
+                    REVENUE_PER_GOOD_ACCOUNT, PAYMENT_PER_ACCOUNT)
+from datetime import date, timedelta
+from sqlalchemy import func, case
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+
+def week_start_for(day):
+    """Return the Monday of the week containing the given day"""
+    return day - timedelta(days=day.weekday())
+
+
+def week_windows(weeks, today=None):
+    """Return (week_start, week_end) pairs for the last N weeks, newest first"""
+    if today is None:
+        today = date.today()
+
+    current_week_start = week_start_for(today)
+    windows = []
+    for i in range(weeks):
+        week_start = current_week_start - timedelta(days=i * 7)
+        windows.append((week_start, week_start + timedelta(days=6)))
+    return windows
+
+
+def _week_group(column):
+    """Column to group a date column by: its week start where the backend can
+    compute one (see _period_bucket), else the date itself.
+
+    Either way each row costs the same however many weeks are requested.
+    """
+    bucket = _period_bucket(column, 'week')
+    return column if bucket is None else bucket
+
+
+def _window_indexes(windows):
+    """Map a grouped week start or date to its index in windows, or None"""
+    indexes = {week_start: i for i, (week_start, _) in enumerate(windows)}
+
+    def window_index(value):
+        if value is None:
+            return None
+        return indexes.get(week_start_for(_as_date(value)))
+    return window_index
+
+
+def with_archive(model, archived_model, start):
+    """model, plus its archive table if days from start on may have been archived"""
+    archived_before = ArchiveState.archived_before_date()
+    if archived_before is not None and start < archived_before:
+        return (model, archived_model)
+    return (model,)
+
+
+def _account_totals(windows):
+    """Total and good account counts per week bucket, one grouped query per table"""
+    window_index = _window_indexes(windows)
+    totals = {}
+    for model in with_archive(Account, ArchivedAccount, windows[-1][0]):
+        group = _week_group(model.date_created)
+        rows = db.session.query(
+            group,
+            func.count(model.id),
+            func.sum(case((model.is_good.is_(True), 1), else_=0))
+        ).filter(
+            model.date_created >= windows[-1][0],
+            model.date_created <= windows[0][1]
+        ).group_by(group).all()
+
+        for value, total, good in rows:
+            index = window_index(value)
+            if index is not None:
+                previous_total, previous_good = totals.get(index, (0, 0))
+                totals[index] = (previous_total + total, previous_good + (good or 0))
+    return totals
+
+
+def _expense_totals(windows):
+    """Summed expense amounts per week bucket, one grouped query per table"""
+    window_index = _window_indexes(windows)
+    totals = {}
+    for model in with_archive(Expense, ArchivedExpense, windows[-1][0]):
+        group = _week_group(model.date_incurred)
+        rows = db.session.query(
+            group,
+            func.sum(model.amount)
+        ).filter(
+            model.date_incurred >= windows[-1][0],
+            model.date_incurred <= windows[0][1]
+        ).group_by(group).all()
+
+        for value, amount in rows:
+            index = window_index(value)
+            if index is not None:
+                totals[index] = (totals.get(index) or 0) + (amount or 0)
+    return totals
+
+
+def summarize_week(week_start, week_end, total_accounts, good_accounts, expenses):
+    """Build the financial summary dict for a single week"""
+    revenue = good_accounts * REVENUE_PER_GOOD_ACCOUNT
+    employee_payments = total_accounts * PAYMENT_PER_ACCOUNT
+    expenses = expenses or 0
+
+    return {
+        'week_start': week_start,
+        'week_end': week_end,
+        'total_accounts': total_accounts,
+        'good_accounts': good_accounts,
+        'revenue': revenue,
+        'employee_payments': employee_payments,
+        'expenses': expenses,
+        'net_profit': revenue - employee_payments - expenses
+    }
+
+
+def weekly_summary(weeks=4, today=None):
+    """Financial summary for the last N weeks, oldest first.
+
+    Weeks are served from the metrics cache when possible. Of the rest, closed
+    weeks are read from their WeeklyReport rollup, and the current week plus
+    any closed week without a rollup are aggregated live with one grouped
+    query against Account and one against Expense.
+    """
+    windows = week_windows(weeks, today)
+    if not windows:
+        return []
+
+    version = metrics_cache.version()
+    summaries = metrics_cache.get_weeks([week_start for week_start, _ in windows])
+
+    missing = [window for window in windows if window[0] not in summaries]
+    if missing:
+        computed = _summarize_windows(missing, current_week_start=windows[0][0])
+        metrics_cache.set_weeks(computed.values(), version)
+        summaries.update(computed)
+
+    # Oldest first
+    return [dict(summaries[week_start]) for week_start, _ in reversed(windows)]
+
+
+def _summarize_windows(windows, current_week_start):
+    """Summaries for the given windows keyed by week_start, without the cache"""
+    # The current week is still changing, so it is never read from a rollup
+    rollups = _weekly_reports([week_start for week_start, _ in windows
+                               if week_start < current_week_start])
+
+    live_windows = [window for window in windows if window[0] not in rollups]
+    account_totals = {}
+    expense_totals = {}
+    if live_windows:
+        account_totals = _account_totals(live_windows)
+        expense_totals = _expense_totals(live_windows)
+
+    summaries = {}
+    for week_start, week_end in windows:
+        report = rollups.get(week_start)
+        if report is not None:
+            summaries[week_start] = summarize_week(week_start, week_end, report.total_accounts or 0,
+                                                   report.good_accounts or 0, report.total_expenses)
+
+    for i, (week_start, week_end) in enumerate(live_windows):
+        total_accounts, good_accounts = account_totals.get(i, (0, 0))
+        summaries[week_start] = summarize_week(week_start, week_end, total_accounts,
+                                               good_accounts, expense_totals.get(i))
+
+    return summaries
+
+
+def _weekly_reports(week_starts):
+    """Existing WeeklyReport rows keyed by week_start"""
+    if not week_starts:
+        return {}
+
+    reports = WeeklyReport.query.filter(WeeklyReport.week_start.in_(week_starts)).all()
+    return {report.week_start: report for report in reports}
+
+
+# WeeklyReport column -> summarize_week key
+WEEKLY_REPORT_TOTALS = {
+    'total_accounts': 'total_accounts',
+    'good_accounts': 'good_accounts',
+    'total_revenue': 'revenue',
+    'total_employee_payments': 'employee_payments',
+    'total_expenses': 'expenses',
+    'net_profit': 'net_profit',
+}
+
+
+def _upsert_weekly_reports(rows):
+    """Insert or update WeeklyReport rows by week_start in one statement.
+
+    Returns False, writing nothing, on backends without an upsert.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        statement = (sqlite.insert if dialect == 'sqlite' else postgresql.insert)(WeeklyReport)
+        statement = statement.on_conflict_do_update(
+            index_elements=['week_start'],
+            set_={column: statement.excluded[column] for column in WEEKLY_REPORT_TOTALS})
+    elif dialect in ('mysql', 'mariadb'):
+        statement = mysql.insert(WeeklyReport)
+        statement = statement.on_duplicate_key_update(
+            {column: statement.inserted[column] for column in WEEKLY_REPORT_TOTALS})
+    else:
+        return False
+
+    db.session.execute(statement, rows)
+    return True
+
+
+def refresh_weekly_reports(days):
+    """Recompute the WeeklyReport rollups for the weeks containing the given days.
+
+    Call this from every write path before committing so the rollups land in
+    the same transaction as the rows they summarise. Where the backend has an
+    upsert the rows are written with it, so two writers creating the same
+    week's rollup cannot collide on the unique week_start index.
+    """
+    week_starts = sorted({week_start_for(day) for day in days}, reverse=True)
+    if not week_starts:
+        return
+
+    windows = [(week_start, week_start + timedelta(days=6)) for week_start in week_starts]
+    account_totals = _account_totals(windows)
+    expense_totals = _expense_totals(windows)
+
+    rows = []
+    for i, (week_start, week_end) in enumerate(windows):
+        total_accounts, good_accounts = account_totals.get(i, (0, 0))
+        summary = summarize_week(week_start, week_end, total_accounts, good_accounts,
+                                 expense_totals.get(i))
+        row = {column: summary[key] for column, key in WEEKLY_REPORT_TOTALS.items()}
+        row.update(week_start=week_start, week_end=week_end)
+        rows.append(row)
+
+    if _upsert_weekly_reports(rows):
+        return
+
+    existing = _weekly_reports(week_starts)
+    for row in rows:
+        report = existing.get(row['week_start'])
+        if report is None:
+            db.session.add(WeeklyReport(**row))
+        else:
+            for column in WEEKLY_REPORT_TOTALS:
+                setattr(report, column, row[column])
+
+
+def rebuild_weekly_reports(start=None, end=None, batch_weeks=52):
+    """Recompute every WeeklyReport rollup between start and end.
+
+    Defaults to the full span of Account and Expense data, archived or not.
+    Each batch of weeks is committed separately. Returns the number of weeks
+    rebuilt.
+    """
+    if start is None or end is None:
+        spans = [db.session.query(func.min(column), func.max(column)).one()
+                 for column in (Account.date_created, Expense.date_incurred,
+                                ArchivedAccount.date_created, ArchivedExpense.date_incurred)]
+
+        first_days = [first for first, _ in spans if first is not None]
+        last_days = [last for _, last in spans if last is not None]
+        if not first_days:
+            return 0
+
+        start = start or min(first_days)
+        end = end or max(last_days)
+
+    week_start = week_start_for(start)
+    rebuilt = 0
+    while week_start <= end:
+        batch = [week_start + timedelta(days=i * 7) for i in range(batch_weeks)]
+        batch = [day for day in batch if day <= end]
+        run_write(refresh_weekly_reports, batch)
+        metrics_cache.invalidate_weeks(batch)
+
+        rebuilt += len(batch)
+        week_start = batch[-1] + timedelta(days=7)
+
+    return rebuilt
+
+
+TIMESERIES_GRANULARITIES = ('day', 'week', 'month')
+
+# Upper bound on buckets per time-series request
+TIMESERIES_MAX_BUCKETS = 1000
+
+
+def period_start_for(day, granularity):
+    """First day of the day/week/month bucket containing day"""
+    if granularity == 'week':
+        return week_start_for(day)
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _next_period(day, granularity):
+    if granularity == 'week':
+        return day + timedelta(days=7)
+    if granularity == 'month':
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return day + timedelta(days=1)
+
+
+def period_starts(start, end, granularity):
+    """Every bucket start from the one containing start up to end"""
+    periods = []
+    period = period_start_for(start, granularity)
+    while period <= end:
+        periods.append(period)
+        period = _next_period(period, granularity)
+    return periods
+
+
+def _period_bucket(column, granularity):
+    """SQL expression truncating a date column to its week or month, if the backend has one"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        if granularity == 'week':
+            return func.date(column, 'weekday 0', '-6 days')
+        return func.strftime('%Y-%m-01', column)
+    if dialect == 'postgresql':
+        return func.date_trunc(granularity, column)
+    return None
+
+
+def _as_date(value):
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    if hasattr(value, 'date') and callable(value.date):
+        return value.date()
+    return value
+
+
+def _grouped_totals(column, granularity, *aggregates, filters=(), totals=None):
+    """{bucket start: aggregate row} for one grouped query over column.
+
+    Rows are first grouped by day, which walks the date index in order, and
+    only the per-day rows are truncated to weeks or months. Backends without
+    a truncation expression get the per-day rows and fold them here. Pass the
+    result of an earlier call as totals to add this query's rows to it.
+    """
+    daily = db.session.query(
+        column.label('day'),
+        *[aggregate.label(f'value_{i}') for i, aggregate in enumerate(aggregates)]
+    ).filter(*filters).group_by(column)
+
+    days = daily.subquery()
+    bucket = None if granularity == 'day' else _period_bucket(days.c.day, granularity)
+    if bucket is None:
+        rows = daily.all()
+    else:
+        rows = db.session.query(
+            bucket, *[func.sum(days.c[f'value_{i}']) for i in range(len(aggregates))]
+        ).group_by(bucket).all()
+
+    totals = {} if totals is None else totals
+    for value, *aggregated in rows:
+        if value is None:
+            continue
+        period = period_start_for(_as_date(value), granularity)
+        previous = totals.get(period)
+        if previous is None:
+            totals[period] = aggregated
+        else:
+            totals[period] = [(a or 0) + (b or 0) for a, b in zip(previous, aggregated)]
+    return totals
+
+
+def timeseries(start, end, granularity='week', employee_id=None, category=None):
+    """Columnar revenue/payments/expenses/profit series between start and end.
+
+    One grouped query against Account and one against Expense, plus one per
+    archive table when the range reaches archived weeks, so the cost scales
+    with the number of buckets rather than rows. employee_id narrows
+    the account-derived series, category narrows expenses. Buckets are
+    labelled by their first day; the first and last may cover only part of
+    their period.
+    """
+    if granularity not in TIMESERIES_GRANULARITIES:
+        raise ValueError(f'Unknown granularity: {granularity}')
+    if start > end:
+        raise ValueError('start must not be after end')
+
+    periods = period_starts(start, end, granularity)
+    if len(periods) > TIMESERIES_MAX_BUCKETS:
+        raise ValueError(f'Too many buckets ({len(periods)}); use a coarser granularity '
+                         f'or a shorter range (limit {TIMESERIES_MAX_BUCKETS})')
+
+    accounts = {}
+    for model in with_archive(Account, ArchivedAccount, start):
+        account_filters = [model.date_created >= start, model.date_created <= end]
+        if employee_id is not None:
+            account_filters.append(model.employee_id == employee_id)
+        _grouped_totals(
+            model.date_created, granularity,
+            func.count(model.id),
+            func.sum(case((model.is_good.is_(True), 1), else_=0)),
+            filters=account_filters, totals=accounts
+        )
+
+    expenses = {}
+    for model in with_archive(Expense, ArchivedExpense, start):
+        expense_filters = [model.date_incurred >= start, model.date_incurred <= end]
+        if category:
+            expense_filters.append(model.category == category)
+        _grouped_totals(model.date_incurred, granularity, func.sum(model.amount),
+                        filters=expense_filters, totals=expenses)
+
+    series = {key: [] for key in ('accounts', 'good_accounts', 'revenue', 'payments',
+                                  'expenses', 'profit')}
+    for period in periods:
+        total_accounts, good_accounts = accounts.get(period, (0, 0))
+        total_accounts = total_accounts or 0
+        good_accounts = good_accounts or 0
+        revenue = good_accounts * REVENUE_PER_GOOD_ACCOUNT
+        payments = total_accounts * PAYMENT_PER_ACCOUNT
+        spent = (expenses.get(period) or [0])[0] or 0
+
+        series['accounts'].append(total_accounts)
+        series['good_accounts'].append(good_accounts)
+        series['revenue'].append(revenue)
+        series['payments'].append(payments)
+        series['expenses'].append(round(spent, 2))
+        series['profit'].append(round(revenue - payments - spent, 2))
+
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'granularity': granularity,
+        'buckets': [period.isoformat() for period in periods],
+        'series': series,
+    }
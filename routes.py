@@ -1,48 +1,73 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify, send_file
-from app import app, db
-from models import Employee, Account, Expense, WeeklyReport
+from flask import render_template, request, redirect, url_for, flash, jsonify, send_file, stream_with_context, abort, current_app
+from werkzeug.http import is_resource_modified
+from app import db
+from models import Employee, Account, Expense, WeeklyReport, ArchivedAccount, ArchivedExpense
+from reporting import weekly_summary, refresh_weekly_reports, rebuild_weekly_reports, timeseries
+from pagination import keyset_paginate
+from cache import metrics_cache
+from filters import filter_accounts, filter_expenses
+import exports
+import project_archive
+import jobs
+from jobs import job_runner
+from importer import import_accounts_csv, import_expenses_csv
+from notifier import change_notifier
+from directory import employee_directory
+from database import run_write
+import search
+import changelog
 from datetime import datetime, date, timedelta
-from sqlalchemy import func, extract
+from sqlalchemy.orm import joinedload
+from urllib.parse import urlencode
 import os
-import zipfile
-import tempfile
-import shutil
+import json
+import time
+import uuid
 
-@app.route('/')
+# Rows per page in the reports employee performance table
+PERFORMANCE_PER_PAGE = 100
+
+# Weeks shown on the dashboard chart and kept live by /api/stream
+DASHBOARD_WEEKS = 4
+
+# Entries per /api/changes response, and the most a client may ask for
+CHANGES_PER_PAGE = 500
+MAX_CHANGES_PER_PAGE = 5000
+
+# (rule, view, options) for every view, added to an app by init_app
+_routes = []
+
+def route(rule, **options):
+    """Register a view under its function name, like app.route"""
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+def init_app(app):
+    """Add every view to app with its original endpoint name"""
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view.__name__, view, **options)
+
+@route('/')
 def index():
     """Dashboard with key metrics"""
-    # Get current week data
-    today = date.today()
-    week_start = today - timedelta(days=today.weekday())
-    week_end = week_start + timedelta(days=6)
-    
     # Calculate metrics
-    total_employees = Employee.query.filter_by(is_active=True).count()
-    
-    # This week's accounts
-    weekly_accounts = Account.query.filter(
-        Account.date_created >= week_start,
-        Account.date_created <= week_end
-    ).all()
+    total_employees = _active_employee_count()
     
-    total_accounts_this_week = len(weekly_accounts)
-    good_accounts_this_week = sum(1 for acc in weekly_accounts if acc.is_good)
+    # This week's figures
+    this_week = weekly_summary(1)[0]
     
-    # Revenue and payments
-    weekly_revenue = good_accounts_this_week * 1400  # 1400 KSH per good account
-    weekly_employee_payments = total_accounts_this_week * 500  # 500 KSH per account
-    
-    # Weekly expenses
-    weekly_expenses = db.session.query(func.sum(Expense.amount)).filter(
-        Expense.date_incurred >= week_start,
-        Expense.date_incurred <= week_end
-    ).scalar() or 0
-    
-    # Net profit
-    net_profit = weekly_revenue - weekly_employee_payments - weekly_expenses
+    total_accounts_this_week = this_week['total_accounts']
+    good_accounts_this_week = this_week['good_accounts']
+    weekly_revenue = this_week['revenue']
+    weekly_employee_payments = this_week['employee_payments']
+    weekly_expenses = this_week['expenses']
+    net_profit = this_week['net_profit']
     
     # Recent activities
-    recent_accounts = Account.query.order_by(Account.created_at.desc()).limit(5).all()
+    recent_accounts = Account.query.options(joinedload(Account.employee)).order_by(
+        Account.created_at.desc()).limit(5).all()
     recent_expenses = Expense.query.order_by(Expense.created_at.desc()).limit(5).all()
     
     return render_template('index.html',
@@ -56,17 +81,17 @@ def index():
                          recent_accounts=recent_accounts,
                          recent_expenses=recent_expenses)
 
-@app.route('/employees')
+@route('/employees')
 def employees():
     """List all employees"""
     employees = Employee.query.filter_by(is_active=True).all()
     return render_template('employees.html', employees=employees)
 
-@app.route('/employees/add', methods=['GET', 'POST'])
+@route('/employees/add', methods=['GET', 'POST'])
 def add_employee():
     """Add new employee"""
     if request.method == 'POST':
-        employee = Employee(
+        fields = dict(
             name=request.form['name'],
             email=request.form['email'],
             phone=request.form.get('phone', ''),
@@ -75,8 +100,9 @@ def add_employee():
         )
         
         try:
-            db.session.add(employee)
-            db.session.commit()
+            run_write(lambda: db.session.add(Employee(**fields)))
+            metrics_cache.invalidate_employees()
+            employee_directory.invalidate()
             flash('Employee added successfully!', 'success')
             return redirect(url_for('employees'))
         except Exception as e:
@@ -85,21 +111,24 @@ def add_employee():
     
     return render_template('add_employee.html')
 
-@app.route('/employees/<int:employee_id>/edit', methods=['GET', 'POST'])
+@route('/employees/<int:employee_id>/edit', methods=['GET', 'POST'])
 def edit_employee(employee_id):
     """Edit employee details"""
     employee = Employee.query.get_or_404(employee_id)
     
     if request.method == 'POST':
-        employee.name = request.form['name']
-        employee.email = request.form['email']
-        employee.phone = request.form.get('phone', '')
-        employee.department = request.form.get('department', '')
-        if request.form.get('hire_date'):
-            employee.hire_date = datetime.strptime(request.form['hire_date'], '%Y-%m-%d').date()
+        def update_employee():
+            employee.name = request.form['name']
+            employee.email = request.form['email']
+            employee.phone = request.form.get('phone', '')
+            employee.department = request.form.get('department', '')
+            if request.form.get('hire_date'):
+                employee.hire_date = datetime.strptime(request.form['hire_date'], '%Y-%m-%d').date()
         
         try:
-            db.session.commit()
+            run_write(update_employee)
+            metrics_cache.invalidate_employees()
+            employee_directory.invalidate()
             flash('Employee updated successfully!', 'success')
             return redirect(url_for('employees'))
         except Exception as e:
@@ -108,14 +137,18 @@ def edit_employee(employee_id):
     
     return render_template('edit_employee.html', employee=employee)
 
-@app.route('/employees/<int:employee_id>/deactivate', methods=['POST'])
+@route('/employees/<int:employee_id>/deactivate', methods=['POST'])
 def deactivate_employee(employee_id):
     """Deactivate an employee"""
     employee = Employee.query.get_or_404(employee_id)
-    employee.is_active = False
+    
+    def deactivate():
+        employee.is_active = False
     
     try:
-        db.session.commit()
+        run_write(deactivate)
+        metrics_cache.invalidate_employees()
+        employee_directory.invalidate()
         flash('Employee deactivated successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -123,35 +156,69 @@ def deactivate_employee(employee_id):
     
     return redirect(url_for('employees'))
 
-@app.route('/accounts')
+@route('/accounts')
 def accounts():
     """List all accounts with filtering"""
-    page = request.args.get('page', 1, type=int)
+    after = request.args.get('after')
+    before = request.args.get('before')
+    with_total = request.args.get('count', 0, type=int) == 1
     employee_id = request.args.get('employee_id', type=int)
-    week_start = request.args.get('week_start')
+    week_start = _week_start_arg()
+    archived = request.args.get('archived', 0, type=int) == 1
+    
+    # Rows moved out by archive.py are listed from the archive table on request
+    model = ArchivedAccount if archived else Account
+    
+    def render_table():
+        query = filter_accounts(model.query.options(joinedload(model.employee)),
+                                employee_id, week_start, model)
+        accounts = keyset_paginate(query, model, after=after, before=before,
+                                   per_page=20, with_total=with_total)
+        return render_template('accounts_table.html', accounts=accounts,
+                               selected_employee_id=employee_id, selected_week=week_start,
+                               with_total=with_total, archived=archived)
     
-    query = Account.query
+    accounts_table = metrics_cache.fragment('accounts', _fragment_key(), render_table)
     
-    # Filter by employee
-    if employee_id:
-        query = query.filter_by(employee_id=employee_id)
+    employees = employee_directory.active()
     
-    # Filter by week
+    return render_template('accounts.html', accounts_table=accounts_table, employees=employees,
+                         selected_employee_id=employee_id, selected_week=week_start,
+                         archived=archived)
+
+def _week_start_arg():
+    """The week_start filter as given, after checking it is a YYYY-MM-DD date"""
+    week_start = request.args.get('week_start')
     if week_start:
-        start_date = datetime.strptime(week_start, '%Y-%m-%d').date()
-        end_date = start_date + timedelta(days=6)
-        query = query.filter(Account.date_created >= start_date, Account.date_created <= end_date)
+        try:
+            datetime.strptime(week_start, '%Y-%m-%d')
+        except ValueError:
+            abort(400)
+    return week_start
+
+@route('/accounts/search')
+def search_accounts():
+    """Full-text search over account number, client, email and notes"""
+    query_text = request.args.get('q', '').strip()
+    employee_id = request.args.get('employee_id', type=int)
     
-    accounts = query.order_by(Account.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    results = search.search_accounts(query_text, after=request.args.get('after'),
+                                     per_page=20, employee_id=employee_id)
     
-    employees = Employee.query.filter_by(is_active=True).all()
+    employees = employee_directory.active()
     
-    return render_template('accounts.html', accounts=accounts, employees=employees,
-                         selected_employee_id=employee_id, selected_week=week_start)
+    return render_template('account_search.html', results=results, employees=employees,
+                         query=query_text, selected_employee_id=employee_id)
+
+@route('/accounts/export')
+def export_accounts():
+    """Stream accounts matching the list filters as CSV or NDJSON"""
+    rows = exports.account_rows(request.args.get('employee_id', type=int),
+                                _week_start_arg(),
+                                archived=request.args.get('archived', 0, type=int) == 1)
+    return _export_response('accounts', exports.ACCOUNT_COLUMNS, rows)
 
-@app.route('/accounts/add', methods=['GET', 'POST'])
+@route('/accounts/add', methods=['GET', 'POST'])
 def add_accounts():
     """Add accounts for employees"""
     if request.method == 'POST':
@@ -168,7 +235,9 @@ def add_accounts():
             status = request.form.get(status_key, 'pending')
             account_statuses.append(status)
         
-        success_count = 0
+        date_created = datetime.strptime(request.form['date_created'], '%Y-%m-%d').date() if request.form.get('date_created') else date.today()
+        
+        new_accounts = []
         for i, account_name in enumerate(account_names):
             if account_name.strip():
                 # Get corresponding data for this account
@@ -180,69 +249,88 @@ def add_accounts():
                 # Determine if account is good (only 'good' status counts as revenue)
                 is_good = (status == 'good')
                 
-                account = Account(
+                new_accounts.append(dict(
                     employee_id=employee_id,
-                    account_number=number or f'ACC{success_count+1:03d}',
+                    account_number=number or f'ACC{len(new_accounts)+1:03d}',
                     client_name=account_name.strip(),
                     client_email=email.strip() if email else None,
                     is_good=is_good,
                     notes=notes,
-                    date_created=datetime.strptime(request.form['date_created'], '%Y-%m-%d').date() if request.form.get('date_created') else date.today()
-                )
-                
-                try:
-                    db.session.add(account)
-                    success_count += 1
-                except Exception as e:
-                    app.logger.error(f"Error adding account: {e}")
+                    date_created=date_created
+                ))
+        
+        def write_accounts():
+            # Built on every attempt, since a retried rollback discards them
+            db.session.add_all([Account(**fields) for fields in new_accounts])
+            refresh_weekly_reports([date_created])
         
         try:
-            db.session.commit()
-            flash(f'{success_count} accounts added successfully!', 'success')
+            run_write(write_accounts)
+            metrics_cache.invalidate_weeks([date_created])
+            _publish_week(date_created)
+            flash(f'{len(new_accounts)} accounts added successfully!', 'success')
             return redirect(url_for('accounts'))
         except Exception as e:
             db.session.rollback()
             flash('Error adding accounts.', 'error')
     
-    employees = Employee.query.filter_by(is_active=True).all()
+    employees = employee_directory.active()
     return render_template('add_accounts.html', employees=employees)
 
-@app.route('/expenses')
+@route('/accounts/import', methods=['GET', 'POST'])
+def import_accounts():
+    """Bulk import accounts from a CSV file"""
+    return _import_csv('accounts', import_accounts_csv)
+
+@route('/expenses')
 def expenses():
     """List all expenses"""
-    page = request.args.get('page', 1, type=int)
+    after = request.args.get('after')
+    before = request.args.get('before')
+    with_total = request.args.get('count', 0, type=int) == 1
     category = request.args.get('category')
+    archived = request.args.get('archived', 0, type=int) == 1
     
-    query = Expense.query
+    model = ArchivedExpense if archived else Expense
+    query = filter_expenses(model.query, category, model)
     
-    if category:
-        query = query.filter_by(category=category)
-    
-    expenses = query.order_by(Expense.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    expenses = keyset_paginate(query, model, after=after, before=before,
+                               per_page=20, with_total=with_total)
     
     # Get unique categories
-    categories = db.session.query(Expense.category).distinct().all()
+    categories = db.session.query(model.category).distinct().all()
     categories = [cat[0] for cat in categories]
     
     return render_template('expenses.html', expenses=expenses, categories=categories,
-                         selected_category=category)
+                         selected_category=category, with_total=with_total, archived=archived)
+
+@route('/expenses/export')
+def export_expenses():
+    """Stream expenses matching the list filters as CSV or NDJSON"""
+    rows = exports.expense_rows(request.args.get('category'),
+                                archived=request.args.get('archived', 0, type=int) == 1)
+    return _export_response('expenses', exports.EXPENSE_COLUMNS, rows)
 
-@app.route('/expenses/add', methods=['GET', 'POST'])
+@route('/expenses/add', methods=['GET', 'POST'])
 def add_expense():
     """Add new expense"""
     if request.method == 'POST':
-        expense = Expense(
+        fields = dict(
             description=request.form['description'],
             amount=float(request.form['amount']),
             category=request.form['category'],
             date_incurred=datetime.strptime(request.form['date_incurred'], '%Y-%m-%d').date() if request.form.get('date_incurred') else date.today()
         )
         
+        def write_expense():
+            # Built on every attempt, since a retried rollback discards it
+            db.session.add(Expense(**fields))
+            refresh_weekly_reports([fields['date_incurred']])
+        
         try:
-            db.session.add(expense)
-            db.session.commit()
+            run_write(write_expense)
+            metrics_cache.invalidate_weeks([fields['date_incurred']])
+            _publish_week(fields['date_incurred'])
             flash('Expense added successfully!', 'success')
             return redirect(url_for('expenses'))
         except Exception as e:
@@ -251,216 +339,396 @@ def add_expense():
     
     return render_template('add_expense.html')
 
-@app.route('/reports')
+@route('/expenses/import', methods=['GET', 'POST'])
+def import_expenses():
+    """Bulk import expenses from a CSV file"""
+    return _import_csv('expenses', import_expenses_csv)
+
+def _import_csv(kind, import_csv):
+    """Shared upload handling for the CSV import pages"""
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('csv_file')
+        if not upload or not upload.filename:
+            flash('Please choose a CSV file to import.', 'error')
+        else:
+            try:
+                result = import_csv(upload.stream, chunk_size=current_app.config['IMPORT_CHUNK_SIZE'])
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"Error importing {kind}: {e}")
+                flash(f'Error importing {kind}. Rows up to the last committed chunk were kept.', 'error')
+            else:
+                flash(f'{result.inserted} {kind} imported, {result.rejected} rows rejected.',
+                      'success' if not result.rejected else 'warning')
+    
+    return render_template('import_csv.html', kind=kind, result=result)
+
+@route('/reports')
 def reports():
     """Financial reports and analytics"""
     # Get date range from query params
-    weeks_back = request.args.get('weeks', 4, type=int)
+    weeks_back = min(request.args.get('weeks', 4, type=int), current_app.config['REPORT_MAX_WEEKS'])
     
-    # Calculate weekly data for the past N weeks
+    # Calculate weekly data for the past N weeks, oldest first
     today = date.today()
-    weekly_data = []
-    
-    for i in range(weeks_back):
-        week_start = today - timedelta(days=today.weekday() + (i * 7))
-        week_end = week_start + timedelta(days=6)
-        
-        # Get accounts for this week
-        weekly_accounts = Account.query.filter(
-            Account.date_created >= week_start,
-            Account.date_created <= week_end
-        ).all()
-        
-        total_accounts = len(weekly_accounts)
-        good_accounts = sum(1 for acc in weekly_accounts if acc.is_good)
-        
-        # Calculate financials
-        revenue = good_accounts * 1400
-        employee_payments = total_accounts * 500
-        
-        # Get expenses for this week
-        weekly_expenses = db.session.query(func.sum(Expense.amount)).filter(
-            Expense.date_incurred >= week_start,
-            Expense.date_incurred <= week_end
-        ).scalar() or 0
-        
-        net_profit = revenue - employee_payments - weekly_expenses
-        
-        weekly_data.append({
-            'week_start': week_start,
-            'week_end': week_end,
-            'total_accounts': total_accounts,
-            'good_accounts': good_accounts,
-            'revenue': revenue,
-            'employee_payments': employee_payments,
-            'expenses': weekly_expenses,
-            'net_profit': net_profit
-        })
-    
-    # Reverse to show oldest first
-    weekly_data.reverse()
-    
-    # Employee performance data
-    employees = Employee.query.filter_by(is_active=True).all()
-    employee_performance = []
-    
+    version = metrics_cache.version()
+    if weeks_back > current_app.config['REPORT_ASYNC_WEEKS']:
+        # Long ranges are computed by a background job while the page polls
+        job = _report_job(weeks_back, today, version)
+        if job['status'] != jobs.FINISHED:
+            args = request.args.to_dict()
+            args['job'] = job['id']
+            return render_template('job_pending.html', job=job,
+                                   title=f'Preparing {weeks_back}-week report',
+                                   redirect_url=url_for('reports', **args))
+        weekly_data = job['result']
+    else:
+        weekly_data = weekly_summary(weeks_back, today)
+    
+    # Employee performance data, ranked and paged in a single query
     current_week_start = today - timedelta(days=today.weekday())
-    
-    for employee in employees:
-        accounts = employee.get_weekly_accounts(current_week_start)
-        good_accounts = employee.get_good_accounts_count(current_week_start)
-        payment = employee.get_total_payment(current_week_start)
-        
-        employee_performance.append({
-            'employee': employee,
-            'total_accounts': len(accounts),
-            'good_accounts': good_accounts,
-            'payment': payment
-        })
+    perf_sort = request.args.get('sort', 'id')
+    if perf_sort not in Employee.PERFORMANCE_SORT_KEYS:
+        perf_sort = 'id'
+    perf_desc = request.args.get('desc', 0, type=int) == 1
+    perf_page = max(request.args.get('perf_page', 1, type=int), 1)
+    
+    def render_performance():
+        employee_performance = Employee.weekly_performance(
+            current_week_start, sort=perf_sort, descending=perf_desc,
+            page=perf_page, per_page=PERFORMANCE_PER_PAGE
+        )
+        perf_pages = max((_active_employee_count() + PERFORMANCE_PER_PAGE - 1) // PERFORMANCE_PER_PAGE, 1)
+        return render_template('reports_performance.html',
+                               employee_performance=employee_performance,
+                               weeks_back=weeks_back,
+                               perf_sort=perf_sort,
+                               perf_desc=perf_desc,
+                               perf_page=perf_page,
+                               perf_pages=perf_pages)
+    
+    # Table sections are re-rendered only after a write changes the data;
+    # weekly_data was read at version, so its table is cached only under it
+    weekly_table = metrics_cache.fragment(
+        'report-weeks', f'{weeks_back}:{today.isoformat()}',
+        lambda: render_template('reports_weekly_table.html', weekly_data=weekly_data),
+        version=version)
+    performance_table = metrics_cache.fragment(
+        'report-performance', f'{current_week_start.isoformat()}:{weeks_back}:{perf_sort}:{perf_desc:d}:{perf_page}',
+        render_performance)
     
     return render_template('reports.html', 
                          weekly_data=weekly_data,
-                         employee_performance=employee_performance,
-                         weeks_back=weeks_back)
+                         weeks_back=weeks_back,
+                         weekly_table=weekly_table,
+                         performance_table=performance_table)
+
+def _fragment_key():
+    """Fragment cache key for every query argument of the current request"""
+    return urlencode(sorted(request.args.items(multi=True)))
+
+def _report_job(weeks_back, today, version):
+    """The background job computing a long weekly report, submitted if needed"""
+    # Identical requests share a job until the data changes; a job id from
+    # the URL is only used while it still matches this request and version
+    key = f'reports:{weeks_back}:{today.isoformat()}:{version}'
+    job_id = request.args.get('job')
+    job = job_runner.get(job_id) if job_id else None
+    if job is None or job.get('key') != key:
+        job_id = job_runner.submit_once(key, 'reports', weekly_summary, weeks_back, today)
+        job = job_runner.get(job_id)
+    return job
+
+@route('/reports/rebuild', methods=['POST'])
+def rebuild_reports():
+    """Rebuild the WeeklyReport rollups in the background"""
+    # Joins a rebuild already in progress, but a finished one runs again
+    job_id = job_runner.submit_once('rebuild-weekly-reports', 'rebuild-weekly-reports',
+                                    rebuild_weekly_reports, reuse_finished=False)
+    return jsonify(_job_status(job_runner.get(job_id))), 202
+
+@route('/jobs/<job_id>')
+def job_status(job_id):
+    """API endpoint for polling a background job"""
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(_job_status(job))
+
+@route('/jobs/<job_id>/download')
+def job_download(job_id):
+    """Download the file produced by a finished export job"""
+    job = job_runner.get(job_id)
+    if job is None or job['name'] != 'export' or job['status'] != jobs.FINISHED:
+        abort(404)
+    path = job['result']
+    if not os.path.exists(path):
+        abort(410)
+    return send_file(path, as_attachment=True,
+                     download_name=os.path.basename(path).split('_', 1)[1])
+
+def _job_status(job):
+    """JSON-safe view of a job record"""
+    status = {key: job[key] for key in ('id', 'name', 'status', 'submitted_at',
+                                        'started_at', 'finished_at', 'error')}
+    status['status_url'] = url_for('job_status', job_id=job['id'])
+    if job['name'] == 'export' and job['status'] == jobs.FINISHED:
+        status['result_url'] = url_for('job_download', job_id=job['id'])
+    return status
+
+@route('/reports/export')
+def export_reports():
+    """Stream the weekly report rows as CSV or NDJSON"""
+    weeks_back = min(max(request.args.get('weeks', 4, type=int), 1), current_app.config['REPORT_MAX_WEEKS'])
+    rows = exports.weekly_report_rows(weeks_back)
+    # Long ranges are written by a background job, as on /reports
+    return _export_response('weekly-reports', exports.WEEKLY_REPORT_COLUMNS, rows,
+                            run_async=weeks_back > current_app.config['REPORT_ASYNC_WEEKS'])
+
+def _export_response(name, columns, rows, run_async=False):
+    """Streaming download response for an export"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        abort(400)
+    compress = request.args.get('gzip', 0, type=int) == 1
+    
+    filename = f'{name}-{date.today().isoformat()}.{fmt}'
+    mimetype = exports.FORMATS[fmt]
+    if compress:
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    
+    if run_async or request.args.get('async', 0, type=int) == 1:
+        # Write the file in the background and let the client poll for it
+        export_dir = os.path.join(current_app.instance_path, 'exports')
+        os.makedirs(export_dir, exist_ok=True)
+        jobs.remove_expired_files(export_dir, current_app.config['JOB_RESULT_TTL'])
+        path = os.path.join(export_dir, f'{uuid.uuid4().hex}_{filename}')
+        job_id = job_runner.submit('export', exports.write_export, path, columns, rows, fmt, compress)
+        return jsonify(_job_status(job_runner.get(job_id))), 202
+    
+    response = current_app.response_class(
+        stream_with_context(exports.encode(columns, rows, fmt, compress)),
+        mimetype=mimetype
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
 
-@app.route('/api/dashboard-data')
+@route('/api/leaderboard')
+def leaderboard():
+    """API endpoint for ranked employee performance"""
+    week_start = request.args.get('week_start')
+    try:
+        week_start = datetime.strptime(week_start, '%Y-%m-%d').date() if week_start else None
+    except ValueError:
+        return jsonify({'error': 'week_start must be YYYY-MM-DD'}), 400
+    
+    sort = request.args.get('sort', 'total_accounts')
+    if sort not in Employee.PERFORMANCE_SORT_KEYS:
+        return jsonify({'error': f'Unknown sort key: {sort}'}), 400
+    
+    performance = Employee.weekly_performance(
+        week_start,
+        sort=sort,
+        descending=request.args.get('desc', 1, type=int) == 1,
+        page=max(request.args.get('page', 1, type=int), 1),
+        per_page=min(max(request.args.get('per_page', 50, type=int), 1), 500)
+    )
+    
+    return jsonify([{
+        'employee_id': perf['employee'].id,
+        'name': perf['employee'].name,
+        'total_accounts': perf['total_accounts'],
+        'good_accounts': perf['good_accounts'],
+        'payment': perf['payment']
+    } for perf in performance])
+
+@route('/api/dashboard-data')
 def dashboard_data():
     """API endpoint for dashboard charts"""
-    # Get last 4 weeks of data
+    # Answer revalidations from the cache version without touching the data
     today = date.today()
-    weeks_data = []
-    
-    for i in range(4):
-        week_start = today - timedelta(days=today.weekday() + (i * 7))
-        week_end = week_start + timedelta(days=6)
-        
-        weekly_accounts = Account.query.filter(
-            Account.date_created >= week_start,
-            Account.date_created <= week_end
-        ).all()
-        
-        total_accounts = len(weekly_accounts)
-        good_accounts = sum(1 for acc in weekly_accounts if acc.is_good)
-        revenue = good_accounts * 1400
-        payments = total_accounts * 500
-        
-        weekly_expenses = db.session.query(func.sum(Expense.amount)).filter(
-            Expense.date_incurred >= week_start,
-            Expense.date_incurred <= week_end
-        ).scalar() or 0
+    etag = f'{metrics_cache.version():.6f}-{today - timedelta(days=today.weekday())}'
+    last_modified = metrics_cache.last_modified()
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        # Get last 4 weeks of data
+        response = _dashboard_chart_response()
+    
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+def _dashboard_chart_response():
+    """JSON chart data for the last 4 weeks"""
+    return jsonify([_chart_week(week) for week in weekly_summary(DASHBOARD_WEEKS)])
+
+def _chart_week(week):
+    """One week of dashboard chart data"""
+    return {
+        'week': week['week_start'].strftime('%b %d'),
+        'week_start': week['week_start'].isoformat(),
+        'total_accounts': week['total_accounts'],
+        'good_accounts': week['good_accounts'],
+        'revenue': week['revenue'],
+        'payments': week['employee_payments'],
+        'expenses': week['expenses'],
+        'profit': week['net_profit']
+    }
+
+def _publish_week(day):
+    """Push the committed totals for day's week to live dashboards, if it is on them"""
+    for week in weekly_summary(DASHBOARD_WEEKS):
+        if week['week_start'] <= day <= week['week_end']:
+            change_notifier.publish('week', _chart_week(week))
+
+def _active_employee_count():
+    """Number of active employees, from the metrics cache when possible"""
+    version = metrics_cache.version()
+    total_employees = metrics_cache.get_active_employees()
+    if total_employees is None:
+        total_employees = Employee.query.filter_by(is_active=True).count()
+        metrics_cache.set_active_employees(total_employees, version)
+    return total_employees
+
+def _dashboard_snapshot():
+    """Everything the live dashboard shows"""
+    return {
+        'total_employees': _active_employee_count(),
+        'weeks': [_chart_week(week) for week in weekly_summary(DASHBOARD_WEEKS)]
+    }
+
+@route('/api/stream')
+def live_stream():
+    """Server-Sent Events stream of dashboard updates"""
+    if not change_notifier.connect(current_app.config['STREAM_MAX_CLIENTS']):
+        # The dashboard falls back to polling /api/dashboard-data
+        return jsonify({'error': 'Too many live dashboards on this worker'}), 503
+    
+    # The generator runs after the request context is gone
+    app = current_app._get_current_object()
+    heartbeat = app.config['STREAM_HEARTBEAT']
+    max_age = app.config['STREAM_MAX_AGE']
+    
+    def sse(event, data):
+        return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+    
+    def snapshot():
+        # Only hold an app context (and a pooled connection) while querying
+        with app.app_context():
+            data = _dashboard_snapshot()
+            version = metrics_cache.version()
+            db.session.remove()
+        return version, sse('snapshot', data)
+    
+    def current_version():
+        with app.app_context():
+            return metrics_cache.version()
+    
+    def events():
+        last_id = change_notifier.last_id
+        version, message = snapshot()
+        yield f'retry: {heartbeat * 1000}\n\n' + message
         
-        weeks_data.append({
-            'week': week_start.strftime('%b %d'),
-            'revenue': revenue,
-            'payments': payments,
-            'expenses': weekly_expenses,
-            'profit': revenue - payments - weekly_expenses
-        })
-    
-    weeks_data.reverse()
-    return jsonify(weeks_data)
-
-@app.route('/download-project')
+        # Close after max_age; EventSource reconnects and gets a fresh snapshot
+        deadline = time.monotonic() + max_age
+        while time.monotonic() < deadline:
+            published = change_notifier.wait(last_id, heartbeat)
+            for last_id, event, data in published:
+                yield sse(event, data)
+            
+            if published:
+                version = current_version()
+            elif current_version() != version:
+                # Changed by another worker, an import or a rebuild
+                version, message = snapshot()
+                yield message
+            else:
+                yield ': keepalive\n\n'
+    
+    response = app.response_class(events(), mimetype='text/event-stream')
+    # Runs however the stream ends, including a client that never reads it
+    response.call_on_close(change_notifier.disconnect)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@route('/api/timeseries')
+def timeseries_data():
+    """API endpoint for revenue/payments/expenses/profit series over any range"""
+    today = date.today()
+    try:
+        end = request.args.get('end')
+        end = datetime.strptime(end, '%Y-%m-%d').date() if end else today
+        start = request.args.get('start')
+        start = datetime.strptime(start, '%Y-%m-%d').date() if start else end - timedelta(weeks=12)
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    
+    # Series only change when the cache version does (the defaults also depend on today)
+    etag = f'{metrics_cache.version():.6f}-{today}'
+    last_modified = metrics_cache.last_modified()
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        try:
+            data = timeseries(
+                start, end,
+                granularity=request.args.get('granularity', 'week'),
+                employee_id=request.args.get('employee_id', type=int),
+                category=request.args.get('category') or None
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        response = jsonify(data)
+    
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+@route('/api/changes')
+def change_feed():
+    """API endpoint for incremental sync: writes after a cursor, oldest first"""
+    if not changelog.is_supported():
+        return jsonify({'error': 'The change feed needs SQLite'}), 501
+    
+    after = request.args.get('after', 0, type=int)
+    limit = request.args.get('limit', CHANGES_PER_PAGE, type=int)
+    if after < 0 or limit < 0:
+        return jsonify({'error': 'after and limit cannot be negative'}), 400
+    
+    limit = min(max(limit, 1), MAX_CHANGES_PER_PAGE)
+    try:
+        return jsonify(changelog.changes_after(after, limit))
+    except changelog.CursorExpired as e:
+        return jsonify({'error': str(e)}), 410
+
+@route('/download-project')
 def download_project():
     """Download the entire project as a ZIP file"""
     try:
-        # Create a temporary directory
-        temp_dir = tempfile.mkdtemp()
-        zip_path = os.path.join(temp_dir, 'company-management-system.zip')
-        
-        # Get current working directory (project root)
-        project_root = os.getcwd()
-        
-        # Files and directories to exclude from the ZIP
-        exclude_patterns = {
-            '.git', '__pycache__', '.pytest_cache', 'node_modules', 
-            '.env', 'venv', '.venv', '.pythonlibs', '.upm', '.cache',
-            '*.pyc', '*.pyo', '*.pyd', '.DS_Store', '.replit.nix'
-        }
-        
-        # Create ZIP file
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(project_root):
-                # Remove excluded directories from dirs list
-                dirs[:] = [d for d in dirs if not any(d == pattern or d.startswith('.') for pattern in exclude_patterns)]
-                
-                for file in files:
-                    # Skip excluded files
-                    if any(file.endswith(pattern.replace('*', '')) or file == pattern for pattern in exclude_patterns):
-                        continue
-                    
-                    file_path = os.path.join(root, file)
-                    arc_path = os.path.relpath(file_path, project_root)
-                    
-                    # Skip if file is in excluded directory
-                    if any(part.startswith('.') and part not in {'.replit'} for part in arc_path.split(os.sep)):
-                        continue
-                    
-                    zipf.write(file_path, arc_path)
-            
-            # Add the comprehensive setup guide
-            with open('LOCAL_SETUP_GUIDE.md', 'r') as f:
-                setup_guide = f.read()
-            
-            zipf.writestr('LOCAL_SETUP_GUIDE.md', setup_guide)
-            
-            # Add a quick install script for Windows
-            install_script_win = """@echo off
-echo Setting up Company Management System...
-echo.
-echo Creating virtual environment...
-python -m venv venv
-echo.
-echo Activating virtual environment...
-call venv\\Scripts\\activate
-echo.
-echo Installing dependencies...
-pip install flask flask-sqlalchemy psycopg2-binary gunicorn werkzeug email-validator sqlalchemy
-echo.
-echo Setup complete! 
-echo.
-echo To run the application:
-echo 1. Run: venv\\Scripts\\activate
-echo 2. Run: python main.py
-echo 3. Open browser to http://localhost:5000
-echo.
-pause
-"""
-            
-            # Add a quick install script for Mac/Linux  
-            install_script_unix = """#!/bin/bash
-echo "Setting up Company Management System..."
-echo
-echo "Creating virtual environment..."
-python3 -m venv venv
-echo
-echo "Activating virtual environment..."
-source venv/bin/activate
-echo
-echo "Installing dependencies..."
-pip install flask flask-sqlalchemy psycopg2-binary gunicorn werkzeug email-validator sqlalchemy
-echo
-echo "Setup complete!"
-echo
-echo "To run the application:"
-echo "1. Run: source venv/bin/activate"
-echo "2. Run: python main.py"  
-echo "3. Open browser to http://localhost:5000"
-echo
-"""
-            
-            zipf.writestr('setup_windows.bat', install_script_win)
-            zipf.writestr('setup_unix.sh', install_script_unix)
+        # Reuse the archive for the current tree, building it only if files changed;
+        # instance/ holds the database, caches and exports, never source
+        zip_path, fingerprint = project_archive.get_archive(
+            current_app.root_path, os.path.join(current_app.instance_path, 'artifacts'),
+            skip_dirs=(current_app.instance_path,)
+        )
         
-        # Send the file
+        # Stream the cached file
         return send_file(
             zip_path,
             as_attachment=True,
-            download_name='company-management-system.zip',
-            mimetype='application/zip'
+            download_name=project_archive.ARCHIVE_NAME,
+            mimetype='application/zip',
+            etag=fingerprint,
+            max_age=0
         )
         
     except Exception as e:
-        app.logger.error(f"Error creating project download: {e}")
+        current_app.logger.error(f"Error creating project download: {e}")
         flash('Error creating download. Please try again.', 'error')
         return redirect(url_for('index'))
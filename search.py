@@ -0,0 +1,166 @@
+"""Full-text search over accounts.
+
+On SQLite the ``account_fts`` FTS5 table indexes the account number, client
+name, client email and notes of every account. It is an external-content
+index over ``account``, so the text is not stored twice, and triggers keep it
+in step with every insert, update and delete, including the executemany
+INSERTs of CSV imports and seeding. Matches are ranked with bm25.
+
+Other backends, and SQLite builds without FTS5, fall back to prefix LIKE
+matching on the same columns, newest first.
+"""
+import re
+from sqlalchemy import text, or_, and_, Float, Integer
+from sqlalchemy.orm import joinedload
+from sqlalchemy.exc import OperationalError
+from app import db
+from models import Account
+from pagination import KeysetPage, keyset_paginate, encode_rank_cursor, decode_rank_cursor
+
+FTS_TABLE = 'account_fts'
+
+# bm25 weights for account_number, client_name, client_email and notes
+FTS_WEIGHTS = (10.0, 5.0, 3.0, 1.0)
+
+# Words of a query beyond this are ignored
+MAX_TERMS = 8
+
+FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        account_number, client_name, client_email, notes,
+        content='account', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS account_fts_insert AFTER INSERT ON account BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, account_number, client_name, client_email, notes)
+        VALUES (new.id, new.account_number, new.client_name, new.client_email, new.notes);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS account_fts_delete AFTER DELETE ON account BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, account_number, client_name, client_email, notes)
+        VALUES ('delete', old.id, old.account_number, old.client_name, old.client_email, old.notes);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS account_fts_update
+        AFTER UPDATE OF account_number, client_name, client_email, notes ON account BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, account_number, client_name, client_email, notes)
+        VALUES ('delete', old.id, old.account_number, old.client_name, old.client_email, old.notes);
+        INSERT INTO {FTS_TABLE}(rowid, account_number, client_name, client_email, notes)
+        VALUES (new.id, new.account_number, new.client_name, new.client_email, new.notes);
+    END""",
+]
+
+
+def search_terms(query_text):
+    """Lower-cased words of a search query"""
+    return re.findall(r'\w+', (query_text or '').lower())[:MAX_TERMS]
+
+
+def create_fts_index(connection):
+    """Create the FTS table and its triggers and index existing rows.
+
+    Returns False, changing nothing, if the database cannot host it.
+    """
+    if connection.dialect.name != 'sqlite':
+        return False
+    try:
+        for statement in FTS_DDL:
+            connection.execute(text(statement))
+    except OperationalError as e:
+        if 'fts5' in str(e).lower():
+            return False
+        raise
+    connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    return True
+
+
+def has_fts_index(connection):
+    if connection.dialect.name != 'sqlite':
+        return False
+    return connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+    ), {'name': FTS_TABLE}).first() is not None
+
+
+def rebuild_index():
+    """Re-index every account and merge the index segments.
+
+    Creates the index first if it is missing. Returns False if the database
+    has no FTS support.
+    """
+    with db.engine.begin() as connection:
+        if not has_fts_index(connection):
+            return create_fts_index(connection)
+        connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"))
+    return True
+
+
+def _match_expression(terms):
+    # Every term must match, each as a prefix; \w+ terms need no escaping
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _fts_search(terms, after, per_page, employee_id):
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    rank = f'bm25({FTS_TABLE}, {weights})'
+    sql = (f'SELECT rowid AS account_id, {rank} AS rank '
+           f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match')
+    params = {'match': _match_expression(terms)}
+
+    # bm25 is lower for better matches, so pages run in ascending (rank, id)
+    position = decode_rank_cursor(after)
+    if position is not None:
+        sql += f' AND ({rank} > :rank OR ({rank} = :rank AND rowid > :row_id))'
+        params['rank'], params['row_id'] = position
+
+    if not employee_id:
+        # Cut the page inside the FTS query so only its rows are joined
+        sql += ' ORDER BY rank, rowid LIMIT :limit'
+        params['limit'] = per_page + 1
+
+    ranked = text(sql).bindparams(**params).columns(account_id=Integer, rank=Float).subquery('ranked')
+    query = db.session.query(Account, ranked.c.rank).options(joinedload(Account.employee)).join(
+        ranked, Account.id == ranked.c.account_id)
+    if employee_id:
+        query = query.filter(Account.employee_id == employee_id)
+
+    rows = query.order_by(ranked.c.rank, Account.id).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    return KeysetPage(
+        [account for account, _ in rows],
+        next_cursor=encode_rank_cursor(rows[-1][1], rows[-1][0].id) if has_more else None
+    )
+
+
+def like_filter(terms):
+    """Prefix match of every term on any searchable column"""
+    clauses = []
+    for term in terms:
+        pattern = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        clauses.append(or_(
+            Account.account_number.ilike(f'{pattern}%', escape='\\'),
+            Account.client_name.ilike(f'{pattern}%', escape='\\'),
+            Account.client_name.ilike(f'% {pattern}%', escape='\\'),
+            Account.client_email.ilike(f'{pattern}%', escape='\\'),
+        ))
+    return and_(*clauses)
+
+
+def search_accounts(query_text, after=None, per_page=20, employee_id=None):
+    """One page of accounts matching query_text, best match first where ranked.
+
+    Returns a KeysetPage; only forward cursors are provided.
+    """
+    terms = search_terms(query_text)
+    if not terms:
+        return KeysetPage([])
+
+    if has_fts_index(db.session.connection()):
+        return _fts_search(terms, after, per_page, employee_id)
+
+    query = Account.query.options(joinedload(Account.employee)).filter(like_filter(terms))
+    if employee_id:
+        query = query.filter(Account.employee_id == employee_id)
+    page = keyset_paginate(query, Account, after=after, per_page=per_page)
+    page.prev_cursor = None
+    return page
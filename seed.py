@@ -0,0 +1,140 @@
+"""Synthetic data for load and benchmark runs.
+
+Generates employees, accounts and expenses spread over a number of years and
+bulk-inserts them in batches with core executemany INSERTs, then rebuilds the
+WeeklyReport rollups. Use ``flask seed`` rather than importing this directly.
+"""
+import itertools
+import random
+from datetime import date, datetime, timedelta
+from app import db
+from cache import metrics_cache
+from directory import employee_directory
+from models import Employee, Account, Expense
+from reporting import rebuild_weekly_reports
+
+FIRST_NAMES = ['Amina', 'Brian', 'Cynthia', 'David', 'Esther', 'Felix', 'Grace', 'Hassan',
+               'Irene', 'James', 'Kevin', 'Lucy', 'Mercy', 'Noah', 'Otieno', 'Purity',
+               'Queen', 'Samuel', 'Tabitha', 'Victor', 'Wanjiru', 'Yusuf', 'Zawadi']
+LAST_NAMES = ['Achieng', 'Barasa', 'Chebet', 'Kamau', 'Kariuki', 'Kiprono', 'Mutua',
+              'Njoroge', 'Odhiambo', 'Omondi', 'Otieno', 'Wafula', 'Wambui', 'Wanjala']
+DEPARTMENTS = ['Sales', 'Field Operations', 'Customer Success', 'Partnerships', 'Support']
+EXPENSE_CATEGORIES = ['Office Rent', 'Utilities', 'Internet & Phone', 'Equipment',
+                      'Software & Licenses', 'Marketing', 'Transportation',
+                      'Meals & Entertainment', 'Training & Development',
+                      'Professional Services', 'Supplies', 'Maintenance', 'Other']
+
+# Share of accounts that turn out good
+GOOD_ACCOUNT_RATE = 0.65
+
+# Relative account volume per weekday, Monday first
+WEEKDAY_WEIGHTS = [1.2, 1.3, 1.3, 1.2, 1.1, 0.6, 0.3]
+
+
+def _day_picker(rng, start, days):
+    """Random day in [start, start + days), weighted towards weekdays"""
+    days = [start + timedelta(days=offset) for offset in range(days)]
+    cum_weights = list(itertools.accumulate(WEEKDAY_WEIGHTS[day.weekday()] for day in days))
+
+    def pick(k):
+        return rng.choices(days, cum_weights=cum_weights, k=k)
+    return pick
+
+
+def _insert_batches(model, rows, batch_size, progress=None):
+    table = model.__table__
+    batch = []
+    inserted = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(table.insert(), batch)
+            db.session.commit()
+            inserted += len(batch)
+            batch = []
+            if progress:
+                progress(model.__name__, inserted)
+    if batch:
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+        inserted += len(batch)
+        if progress:
+            progress(model.__name__, inserted)
+    return inserted
+
+
+def _employee_rows(rng, count, start):
+    taken = db.session.query(db.func.count(Employee.id)).scalar() or 0
+    created_at = datetime.utcnow()
+    for i in range(count):
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+        number = taken + i + 1
+        yield {
+            'name': name,
+            'email': f"{name.lower().replace(' ', '.')}.{number}@example.com",
+            'phone': f'+2547{rng.randint(10000000, 99999999)}',
+            'department': rng.choice(DEPARTMENTS),
+            'hire_date': start + timedelta(days=rng.randint(0, 365)),
+            'is_active': rng.random() > 0.05,
+            'created_at': created_at,
+        }
+
+
+def _account_rows(rng, count, employee_ids, pick_days, batch_size):
+    produced = 0
+    while produced < count:
+        size = min(batch_size, count - produced)
+        for day in pick_days(size):
+            produced += 1
+            created_at = datetime.combine(day, datetime.min.time()) + timedelta(
+                seconds=rng.randint(8 * 3600, 19 * 3600))
+            yield {
+                'employee_id': rng.choice(employee_ids),
+                'account_number': f'ACC{produced:08d}',
+                'client_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                'client_email': f'client{produced}@example.com' if rng.random() < 0.7 else None,
+                'is_good': rng.random() < GOOD_ACCOUNT_RATE,
+                'notes': '',
+                'date_created': day,
+                'created_at': created_at,
+            }
+
+
+def _expense_rows(rng, count, pick_days):
+    for i, day in enumerate(pick_days(count)):
+        yield {
+            'description': f'{rng.choice(EXPENSE_CATEGORIES)} #{i + 1}',
+            'amount': round(rng.lognormvariate(7.5, 1.0), 2),
+            'category': rng.choice(EXPENSE_CATEGORIES),
+            'date_incurred': day,
+            'created_at': datetime.combine(day, datetime.min.time()) + timedelta(hours=12),
+        }
+
+
+def seed_database(employees=50, accounts=10000, expenses=1000, years=1,
+                  batch_size=20000, random_seed=42, progress=None):
+    """Insert synthetic rows and rebuild the rollups; returns the counts inserted"""
+    rng = random.Random(random_seed)
+    end = date.today()
+    start = end - timedelta(days=int(365 * years))
+    pick_days = _day_picker(rng, start, (end - start).days + 1)
+
+    counts = {'employees': _insert_batches(Employee, _employee_rows(rng, employees, start),
+                                           batch_size, progress)}
+
+    employee_ids = [employee_id for (employee_id,) in db.session.query(Employee.id)]
+    if not employee_ids:
+        raise ValueError('Cannot seed accounts without any employees')
+
+    counts['accounts'] = _insert_batches(
+        Account, _account_rows(rng, accounts, employee_ids, pick_days, batch_size),
+        batch_size, progress)
+    counts['expenses'] = _insert_batches(Expense, _expense_rows(rng, expenses, pick_days),
+                                         batch_size, progress)
+    counts['weekly_reports'] = rebuild_weekly_reports(start, end)
+
+    # Cached summaries, counts and the directory predate every seeded row
+    metrics_cache.invalidate_weeks(start + timedelta(days=offset) for offset in range((end - start).days + 1))
+    metrics_cache.invalidate_employees()
+    employee_directory.invalidate()
+    return counts
@@ -3,6 +3,10 @@
  * Handles chart initialization and dynamic data loading
  */
 
+// Dashboard chart and the weeks it shows (oldest first), kept current by live updates
+let financialChart = null;
+let dashboardWeeks = null;
+
 // Initialize financial chart for dashboard
 function initializeFinancialChart() {
     fetch('/api/dashboard-data')
@@ -11,7 +15,11 @@ function initializeFinancialChart() {
             const ctx = document.getElementById('financialChart');
             if (!ctx) return;
             
-            new Chart(ctx, {
+            // A live snapshot may have arrived first; it is newer
+            if (!dashboardWeeks) dashboardWeeks = data;
+            data = dashboardWeeks;
+            
+            financialChart = new Chart(ctx, {
                 type: 'bar',
                 data: {
                     labels: data.map(week => week.week),
@@ -91,11 +99,94 @@ function formatCurrency(amount) {
     }).format(amount);
 }
 
-// Update live metrics (could be called periodically)
+// Redraw the chart from dashboardWeeks
+function refreshFinancialChart() {
+    if (!financialChart || !dashboardWeeks) return;
+    
+    financialChart.data.labels = dashboardWeeks.map(week => week.week);
+    const fields = ['revenue', 'payments', 'expenses', 'profit'];
+    fields.forEach((field, i) => {
+        financialChart.data.datasets[i].data = dashboardWeeks.map(week => week[field]);
+    });
+    financialChart.update();
+}
+
+// Write a value into every element tagged with data-metric="name"
+function setMetric(name, value) {
+    document.querySelectorAll(`[data-metric="${name}"]`).forEach(el => {
+        el.textContent = Math.round(value).toString();
+    });
+}
+
+// Update the "this week" cards from the newest dashboard week
+function updateWeekMetrics(week) {
+    ['total_accounts', 'good_accounts', 'revenue', 'payments', 'expenses', 'profit'].forEach(name => {
+        if (week[name] !== undefined) setMetric(name, week[name]);
+    });
+    
+    const positive = week.profit >= 0;
+    document.querySelectorAll('[data-profit-class]').forEach(el => {
+        const prefix = el.dataset.profitClass;
+        el.classList.toggle(`${prefix}-success`, positive);
+        el.classList.toggle(`${prefix}-danger`, !positive);
+    });
+}
+
+// Replace the whole dashboard state (stream snapshot or polled data)
+function applyDashboardSnapshot(weeks, totalEmployees) {
+    dashboardWeeks = weeks;
+    refreshFinancialChart();
+    if (weeks.length) updateWeekMetrics(weeks[weeks.length - 1]);
+    if (totalEmployees !== undefined) setMetric('total_employees', totalEmployees);
+}
+
+// Apply the new totals of a single week, if it is on the dashboard
+function applyWeekUpdate(week) {
+    if (!dashboardWeeks) return;
+    
+    const index = dashboardWeeks.findIndex(w => w.week_start === week.week_start);
+    if (index === -1) return;
+    
+    dashboardWeeks[index] = week;
+    refreshFinancialChart();
+    if (index === dashboardWeeks.length - 1) updateWeekMetrics(week);
+}
+
+// Update live metrics by polling the (ETag-validated) dashboard data
 function updateLiveMetrics() {
-    // This function could fetch updated metrics via AJAX
-    // For now, it's a placeholder for future enhancements
-    console.log('Live metrics update - placeholder');
+    fetch('/api/dashboard-data', { cache: 'no-cache' })
+        .then(response => response.json())
+        .then(data => applyDashboardSnapshot(data))
+        .catch(error => {
+            console.error('Error refreshing dashboard data:', error);
+        });
+}
+
+// Follow /api/stream, falling back to polling when SSE is unavailable
+function startLiveUpdates(pollMinutes = 1) {
+    if (!window.EventSource) {
+        startAutoRefresh(pollMinutes);
+        return;
+    }
+    
+    const source = new EventSource('/api/stream');
+    
+    source.addEventListener('snapshot', event => {
+        const data = JSON.parse(event.data);
+        applyDashboardSnapshot(data.weeks, data.total_employees);
+    });
+    
+    source.addEventListener('week', event => {
+        applyWeekUpdate(JSON.parse(event.data));
+    });
+    
+    source.onerror = () => {
+        // CONNECTING means the browser is retrying by itself; CLOSED means the
+        // server refused the stream (e.g. 503 when the worker is full)
+        if (source.readyState === EventSource.CLOSED) {
+            startAutoRefresh(pollMinutes);
+        }
+    };
 }
 
 // Initialize tooltips for Bootstrap components
@@ -144,6 +235,7 @@ window.dashboardUtils = {
     initializeFinancialChart,
     formatCurrency,
     updateLiveMetrics,
+    startLiveUpdates,
     startAutoRefresh,
     stopAutoRefresh,
     validatePositiveNumber,
@@ -0,0 +1,49 @@
+import pytest
+from app import create_app, db
+
+
+def make_app(directory, **config):
+    """An isolated app on its own SQLite file, with the schema applied"""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{directory / 'test.db'}",
+        'TEMPLATE_CACHE_DIR': str(directory / 'jinja-cache'),
+        'METRICS_CACHE_URL': 'memory://',
+        'INSTRUMENTATION_ENABLED': False,
+        'LOG_LEVEL': 'WARNING',
+        **config,
+    })
+    with app.app_context():
+        import migrations
+        migrations.init_db()
+    return app
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path)
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture(scope='module')
+def seeded_app(request, tmp_path_factory):
+    """Two years of synthetic data with rebuilt rollups, shared by a module's tests.
+
+    Parametrize indirectly with 'archived' to move everything older than a
+    year into the archive tables first.
+    """
+    app = make_app(tmp_path_factory.mktemp('seeded'))
+    with app.app_context():
+        from seed import seed_database
+        seed_database(employees=15, accounts=4000, expenses=600, years=2, random_seed=7)
+        if getattr(request, 'param', 'live') == 'archived':
+            import archive
+            archive.archive_before(archive.archive_horizon(52))
+        yield app
+        db.session.remove()
@@ -0,0 +1,172 @@
+"""Cache backends and the write-time invalidation of cached metrics and pages."""
+import os
+import re
+import time
+from datetime import date, timedelta
+from cache import MemoryBackend, FileBackend, metrics_cache
+from conftest import make_app
+from reporting import weekly_summary
+
+
+def add_employee(client, name='Ann', email='ann@example.com'):
+    client.post('/employees/add', data={'name': name, 'email': email})
+
+
+def add_accounts(client, *names, good=False):
+    data = {'employee_id': '1', 'account_names': list(names), 'account_numbers': list(names)}
+    if good:
+        data.update({f'account_status_{i}': 'good' for i in range(len(names))})
+    client.post('/accounts/add', data=data)
+
+
+def test_memory_backend_expiry_and_byte_cap():
+    backend = MemoryBackend(max_bytes=100_000)
+    backend.set('short', 'x', ttl=0.01)
+    time.sleep(0.02)
+    assert backend.get('short') is None
+
+    for i in range(10):
+        backend.set(f'page:{i}', 'x' * 30_000, ttl=60)
+    assert backend._bytes <= 100_000
+    assert backend.get('page:9') is not None and backend.get('page:0') is None
+    backend.set('huge', 'x' * 200_000)
+    assert backend.get('huge') is None
+
+
+def test_file_backend_removes_expired_files(tmp_path):
+    backend = FileBackend(str(tmp_path), sweep_interval=3600)
+    backend.set('version', 1.0)
+    backend.set('read', 'a', ttl=0.01)
+    backend.set('swept', 'b', ttl=0.01)
+    backend.set('kept', 'c', ttl=60)
+    time.sleep(0.02)
+
+    assert backend.get('read') is None
+    assert len(os.listdir(tmp_path)) == 3
+    assert backend.sweep() == 1
+    assert len(os.listdir(tmp_path)) == 2
+    assert (backend.get('version'), backend.get('kept')) == (1.0, 'c')
+
+
+def test_week_summary_is_dropped_by_a_write(client):
+    add_employee(client)
+    assert weekly_summary(1)[0]['total_accounts'] == 0
+    add_accounts(client, 'C1', 'C2', good=True)
+    week = weekly_summary(1)[0]
+    assert (week['total_accounts'], week['good_accounts']) == (2, 2)
+
+    client.post('/expenses/add', data={'description': 'Fuel', 'amount': '250', 'category': 'Travel'})
+    assert weekly_summary(1)[0]['net_profit'] == 2 * 1400 - 2 * 500 - 250
+
+
+def test_week_summary_computed_before_a_write_is_not_served(app):
+    from reporting import week_start_for
+    week_start = week_start_for(date.today())
+    version = metrics_cache.version()
+    stale = dict(weekly_summary(2)[-1], total_accounts=-1)
+
+    # A writer commits between the reader's version check and its set
+    metrics_cache.invalidate_weeks([date.today()])
+    metrics_cache.backend.set(metrics_cache.week_key(week_start), (version, stale), 60)
+    assert metrics_cache.get_weeks([week_start]) == {}
+    assert weekly_summary(1)[0]['total_accounts'] == 0
+
+    # Other weeks keep their entries across the write
+    last_week = week_start - timedelta(weeks=1)
+    assert last_week in metrics_cache.get_weeks([last_week])
+
+
+def test_dashboard_etag_changes_with_the_data(client):
+    first = client.get('/api/dashboard-data')
+    etag = first.headers['ETag']
+    assert client.get('/api/dashboard-data', headers={'If-None-Match': etag}).status_code == 304
+
+    add_employee(client)
+    add_accounts(client, 'C1')
+    second = client.get('/api/dashboard-data', headers={'If-None-Match': etag})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != etag
+
+
+def test_employee_writes_refresh_directory_and_counts(client):
+    add_employee(client)
+    assert 'Ann' in client.get('/accounts').get_data(as_text=True)
+    add_employee(client, 'Bob Newhire', 'bob@example.com')
+    assert 'Bob Newhire' in client.get('/accounts/add').get_data(as_text=True)
+    client.post('/employees/2/deactivate')
+    assert 'Bob Newhire' not in client.get('/accounts/add').get_data(as_text=True)
+
+
+def test_seeding_drops_cached_summaries_and_directory(client):
+    from seed import seed_database
+    from models import Account, Employee
+    assert weekly_summary(1)[0]['total_accounts'] == 0
+    client.get('/accounts/add')
+
+    seed_database(employees=3, accounts=200, expenses=20, years=0.1, random_seed=1)
+    this_week = weekly_summary(1)[0]
+    assert this_week['total_accounts'] == Account.query.filter(
+        Account.date_created >= this_week['week_start']).count() > 0
+    seeded = Employee.query.filter_by(is_active=True).first()
+    assert seeded.name in client.get('/accounts/add').get_data(as_text=True)
+
+
+def test_list_fragment_shows_new_rows(client):
+    add_employee(client)
+    add_accounts(client, 'First Client')
+    assert 'First Client' in client.get('/accounts').get_data(as_text=True)
+    add_accounts(client, 'Second Client')
+    assert 'Second Client' in client.get('/accounts').get_data(as_text=True)
+
+
+def test_fragment_is_not_cached_from_older_data(app):
+    version = metrics_cache.version()
+    metrics_cache.invalidate()
+    assert metrics_cache.fragment('test', 'key', lambda: 'old', version=version) == 'old'
+    assert metrics_cache.fragment('test', 'key', lambda: 'new') == 'new'
+
+
+def test_reloaded_report_job_url_shows_current_data(tmp_path):
+    app = make_app(tmp_path, REPORT_ASYNC_WEEKS=2)
+    client = app.test_client()
+
+    def report(url):
+        """Follow the pending page to the finished report; returns (url, this week's total)"""
+        for _ in range(200):
+            html = client.get(url).get_data(as_text=True)
+            job = re.search(r'job=([0-9a-f]{32})', html)
+            if job is None:
+                weekly_table = html[html.index('Weekly Breakdown'):]
+                totals = re.findall(r'</strong>\s*</td>\s*<td>(\d+)</td>', weekly_table)
+                return url, int(totals[-1])
+            url = f'/reports?weeks=5&job={job.group(1)}'
+            time.sleep(0.02)
+        raise AssertionError('report job did not finish')
+
+    with app.app_context():
+        add_employee(client)
+        add_accounts(client, 'C1', 'C2', 'C3')
+        url, total = report('/reports?weeks=5')
+        assert total == 3
+
+        add_accounts(client, 'C4')
+        assert report(url)[1] == 4
+        assert report('/reports?weeks=5')[1] == 4
+
+
+def test_workers_sharing_a_file_cache_see_each_others_writes(tmp_path):
+    config = {'METRICS_CACHE_URL': f"file://{tmp_path / 'cache'}"}
+    worker_a = make_app(tmp_path, **config)
+    worker_b = make_app(tmp_path, **config)
+    client_a, client_b = worker_a.test_client(), worker_b.test_client()
+
+    with worker_a.app_context():
+        add_employee(client_a)
+    with worker_b.app_context():
+        assert 'Ann' in client_b.get('/accounts/add').get_data(as_text=True)
+        etag = client_b.get('/api/dashboard-data').headers['ETag']
+    with worker_a.app_context():
+        add_accounts(client_a, 'Shared Client')
+    with worker_b.app_context():
+        assert 'Shared Client' in client_b.get('/accounts').get_data(as_text=True)
+        assert client_b.get('/api/dashboard-data', headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,120 @@
+"""Change feed entries written by the write routes, imports and archiving."""
+import io
+from datetime import date, timedelta
+from app import db
+from models import ChangeLog
+
+
+def feed(client, after=0, limit=None):
+    url = f'/api/changes?after={after}' + (f'&limit={limit}' if limit else '')
+    response = client.get(url)
+    assert response.status_code == 200
+    return response.json
+
+
+def ops(changes):
+    return [(change['entity'], change['id'], change['op']) for change in changes]
+
+
+def add_employee(client, name, email):
+    return client.post('/employees/add', data={'name': name, 'email': email, 'hire_date': '2024-01-01'})
+
+
+def test_empty_feed(client):
+    assert feed(client) == {'changes': [], 'next_cursor': 0, 'has_more': False, 'latest_cursor': 0}
+
+
+def test_route_writes_are_logged_in_order(client):
+    add_employee(client, 'Ann', 'ann@example.com')
+    add_employee(client, 'Bob', 'bob@example.com')
+    client.post('/employees/1/edit', data={'name': 'Ann B', 'email': 'ann@example.com'})
+    client.post('/employees/2/deactivate')
+    client.post('/accounts/add', data={'employee_id': '1', 'account_names': ['C1', 'C2'],
+                                       'account_numbers': ['N1', 'N2']})
+    client.post('/expenses/add', data={'description': 'Fuel', 'amount': '10', 'category': 'Travel'})
+
+    data = feed(client)
+    assert ops(data['changes']) == [
+        ('employee', 1, 'insert'), ('employee', 2, 'insert'), ('employee', 1, 'update'),
+        ('employee', 2, 'deactivate'), ('account', 1, 'insert'), ('account', 2, 'insert'),
+        ('expense', 1, 'insert'),
+    ]
+    assert [change['cursor'] for change in data['changes']] == list(range(1, 8))
+    assert data['next_cursor'] == data['latest_cursor'] == 7
+
+    # Entries carry the record as it is now
+    ann = data['changes'][0]['record']
+    assert ann['name'] == 'Ann B' and ann['hire_date'] == '2024-01-01'
+    assert data['changes'][6]['record']['archived'] is False
+
+
+def test_failed_and_unchanged_writes_leave_no_entry(client):
+    add_employee(client, 'Ann', 'ann@example.com')
+    add_employee(client, 'Duplicate', 'ann@example.com')
+    client.post('/employees/1/edit', data={'name': 'Ann', 'email': 'ann@example.com',
+                                           'hire_date': '2024-01-01'})
+    assert ops(feed(client)['changes']) == [('employee', 1, 'insert')]
+
+
+def test_csv_import_is_logged(client):
+    add_employee(client, 'Ann', 'ann@example.com')
+    from importer import import_accounts_csv
+    csv = 'employee_id,client_name\n' + '1,Client\n' * 3
+    assert import_accounts_csv(io.BytesIO(csv.encode())).inserted == 3
+    assert ops(feed(client, after=1)['changes']) == [('account', i, 'insert') for i in (1, 2, 3)]
+
+
+def test_batches_follow_the_cursor(client):
+    for i in range(5):
+        add_employee(client, f'E{i}', f'e{i}@example.com')
+
+    seen, cursor = [], 0
+    while True:
+        data = feed(client, after=cursor, limit=2)
+        seen += [change['id'] for change in data['changes']]
+        cursor = data['next_cursor']
+        if not data['has_more']:
+            break
+    assert seen == [1, 2, 3, 4, 5]
+    assert feed(client, after=cursor)['changes'] == []
+
+
+def test_archiving_is_not_logged_and_records_stay_visible(client):
+    add_employee(client, 'Ann', 'ann@example.com')
+    old = date.today() - timedelta(weeks=80)
+    for number in ('OLD', 'NEW'):
+        client.post('/accounts/add', data={'employee_id': '1', 'account_names': number,
+                                           'account_numbers': number,
+                                           'date_created': old.isoformat()})
+    client.post('/accounts/add', data={'employee_id': '1', 'account_names': 'Now',
+                                       'account_numbers': 'NOW'})
+    before = feed(client)['latest_cursor']
+
+    import archive
+    assert archive.archive_before(date.today() - timedelta(weeks=52))['accounts'] == 2
+    data = feed(client)
+    assert data['latest_cursor'] == before
+    assert [change['record']['archived'] for change in data['changes'][1:]] == [True, True, False]
+
+
+def test_pruned_cursor_is_gone(client):
+    for i in range(3):
+        add_employee(client, f'E{i}', f'e{i}@example.com')
+    import changelog
+    assert changelog.prune_change_log(days=-1) == 2
+    assert db.session.query(ChangeLog.id).all() == [(3,)]
+
+    response = client.get('/api/changes?after=0')
+    assert response.status_code == 410
+    assert ops(feed(client, after=2)['changes']) == [('employee', 3, 'insert')]
+
+
+def test_negative_cursor_or_limit_is_rejected(client):
+    for i in range(3):
+        add_employee(client, f'E{i}', f'e{i}@example.com')
+    import changelog
+    changelog.prune_change_log(days=-1)
+
+    assert client.get('/api/changes?after=-5').status_code == 400
+    assert client.get('/api/changes?limit=-1').status_code == 400
+    assert ops(feed(client, after=2, limit=0)['changes']) == [('employee', 3, 'insert')]
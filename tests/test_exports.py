@@ -0,0 +1,25 @@
+"""Streaming account, expense and weekly report exports."""
+import json
+
+
+def test_account_export_filters_by_week(client):
+    client.post('/employees/add', data={'name': 'Ann', 'email': 'ann@example.com'})
+    for day in ('2024-03-04', '2024-03-11'):
+        client.post('/accounts/add', data={'employee_id': '1', 'account_names': f'Client {day}',
+                                           'account_numbers': day, 'date_created': day})
+
+    response = client.get('/accounts/export?format=ndjson&week_start=2024-03-04')
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['account_number'] for row in rows] == ['2024-03-04']
+
+
+def test_malformed_week_start_is_a_bad_request(client):
+    assert client.get('/accounts/export?week_start=bad').status_code == 400
+    assert client.get('/accounts?week_start=2024-13-40').status_code == 400
+
+
+def test_report_export_clamps_weeks(client):
+    response = client.get('/reports/export?weeks=-5')
+    assert response.status_code == 200
+    assert len(response.get_data(as_text=True).splitlines()) == 2
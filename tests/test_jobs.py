@@ -0,0 +1,43 @@
+"""Background job deduplication."""
+import threading
+import time
+from jobs import job_runner, FINISHED, FAILED
+
+
+def wait(job_id):
+    for _ in range(500):
+        job = job_runner.get(job_id)
+        if job['status'] in (FINISHED, FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError('job did not finish')
+
+
+def test_running_job_is_shared_and_finished_result_reused(app):
+    release = threading.Event()
+    first = job_runner.submit_once('key', 'test', release.wait, 5)
+    assert job_runner.submit_once('key', 'test', release.wait, 5) == first
+    release.set()
+    assert wait(first)['status'] == FINISHED
+    assert job_runner.submit_once('key', 'test', release.wait, 5) == first
+
+
+def test_finished_job_runs_again_without_reuse_finished(app):
+    first = job_runner.submit_once('effect', 'test', time.sleep, 0, reuse_finished=False)
+    wait(first)
+    second = job_runner.submit_once('effect', 'test', time.sleep, 0, reuse_finished=False)
+    assert second != first
+
+
+def test_failed_job_is_not_reused(app):
+    first = job_runner.submit_once('broken', 'test', int, 'not a number')
+    assert wait(first)['status'] == FAILED
+    assert job_runner.submit_once('broken', 'test', int, '1') != first
+
+
+def test_rebuild_endpoint_runs_each_time(client):
+    first = client.post('/reports/rebuild').json
+    wait(first['id'])
+    second = client.post('/reports/rebuild').json
+    assert second['id'] != first['id']
+    assert wait(second['id'])['status'] == FINISHED
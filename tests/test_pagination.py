@@ -0,0 +1,65 @@
+"""Keyset cursors and pages for the account and expense lists."""
+from datetime import datetime
+import pytest
+from models import Account, Expense
+from pagination import (encode_cursor, decode_cursor, encode_rank_cursor, decode_rank_cursor,
+                        keyset_paginate)
+
+
+def test_cursor_round_trip():
+    position = (datetime(2024, 2, 29, 13, 5, 7, 123456), 987654)
+    cursor = encode_cursor(*position)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == position
+
+
+def test_rank_cursor_round_trip():
+    assert decode_rank_cursor(encode_rank_cursor(-3.25e-06, 42)) == (-3.25e-06, 42)
+
+
+@pytest.mark.parametrize('cursor', [None, '', 'not-base64!', 'bm90aGluZw', encode_rank_cursor(1.0, 2)])
+def test_malformed_cursor_is_ignored(cursor):
+    assert decode_cursor(cursor) is None
+
+
+def newest_first(model):
+    return [row.id for row in model.query.order_by(model.created_at.desc(), model.id.desc())]
+
+
+@pytest.mark.parametrize('model', [Account, Expense])
+def test_pages_walk_every_row_forwards_and_back(seeded_app, model):
+    expected = newest_first(model)
+
+    pages = []
+    page = keyset_paginate(model.query, model, per_page=97)
+    pages.append(page)
+    while page.has_next:
+        page = keyset_paginate(model.query, model, after=page.next_cursor, per_page=97)
+        pages.append(page)
+    assert [row.id for page in pages for row in page.items] == expected
+    assert not pages[0].has_prev
+
+    # Walking back from the last page returns the same pages in reverse
+    back = [pages[-1]]
+    while back[-1].has_prev:
+        back.append(keyset_paginate(model.query, model, before=back[-1].prev_cursor, per_page=97))
+    back_ids = [[row.id for row in page.items] for page in reversed(back)]
+    assert back_ids == [[row.id for row in page.items] for page in pages]
+
+
+def test_pages_break_created_at_ties_by_id(app):
+    from app import db
+    from models import Employee
+    db.session.add(Employee(name='Tie', email='tie@example.com'))
+    db.session.flush()
+    created_at = datetime(2024, 1, 1, 9, 0)
+    db.session.add_all([Account(employee_id=1, account_number=f'T{i}', client_name='Tie',
+                                created_at=created_at) for i in range(5)])
+    db.session.commit()
+
+    first = keyset_paginate(Account.query, Account, per_page=2, with_total=True)
+    second = keyset_paginate(Account.query, Account, after=first.next_cursor, per_page=2)
+    third = keyset_paginate(Account.query, Account, after=second.next_cursor, per_page=2)
+    assert first.total == 5
+    assert [row.id for page in (first, second, third) for row in page.items] == [5, 4, 3, 2, 1]
+    assert not third.has_next
@@ -0,0 +1,118 @@
+"""Grouped report queries against the per-week loops they replaced."""
+from datetime import date, timedelta
+import pytest
+from app import db
+from models import Employee, Account, Expense, ArchivedAccount, ArchivedExpense
+from reporting import weekly_summary, timeseries, week_start_for, period_starts, _next_period
+
+pytestmark = pytest.mark.parametrize('seeded_app', ['live', 'archived'], indirect=True)
+
+ACCOUNT_TABLES = (Account, ArchivedAccount)
+EXPENSE_TABLES = (Expense, ArchivedExpense)
+
+
+def loop_accounts(first, last, employee_id=None):
+    """(total, good) accounts dated first..last, one row at a time"""
+    total = good = 0
+    for model in ACCOUNT_TABLES:
+        query = model.query.filter(model.date_created >= first, model.date_created <= last)
+        if employee_id is not None:
+            query = query.filter(model.employee_id == employee_id)
+        accounts = query.all()
+        total += len(accounts)
+        good += sum(1 for account in accounts if account.is_good)
+    return total, good
+
+
+def loop_expenses(first, last):
+    return sum(db.session.query(db.func.sum(model.amount)).filter(
+        model.date_incurred >= first, model.date_incurred <= last).scalar() or 0
+        for model in EXPENSE_TABLES)
+
+
+@pytest.mark.parametrize('weeks', [1, 4, 60, 104])
+def test_weekly_summary_matches_per_week_loop(seeded_app, weeks):
+    today = date.today()
+    summary = weekly_summary(weeks, today)
+    assert len(summary) == weeks
+
+    for i, week in enumerate(reversed(summary)):
+        week_start = week_start_for(today) - timedelta(weeks=i)
+        week_end = week_start + timedelta(days=6)
+        total, good = loop_accounts(week_start, week_end)
+        expenses = loop_expenses(week_start, week_end)
+
+        assert (week['week_start'], week['week_end']) == (week_start, week_end)
+        assert (week['total_accounts'], week['good_accounts']) == (total, good)
+        assert week['revenue'] == good * 1400
+        assert week['employee_payments'] == total * 500
+        assert week['expenses'] == pytest.approx(expenses)
+        assert week['net_profit'] == pytest.approx(good * 1400 - total * 500 - expenses)
+
+
+def test_live_week_totals_match_per_week_loop(seeded_app):
+    # Without rollups every week is aggregated from the raw rows
+    from models import WeeklyReport
+    from reporting import week_windows, _summarize_windows
+    windows = week_windows(110)
+    db.session.query(WeeklyReport).delete()
+    try:
+        summaries = _summarize_windows(windows[::3], current_week_start=windows[0][0])
+    finally:
+        db.session.rollback()
+
+    assert len(summaries) == len(windows[::3])
+    for week_start, week_end in windows[::3]:
+        total, good = loop_accounts(week_start, week_end)
+        assert (summaries[week_start]['total_accounts'], summaries[week_start]['good_accounts']) == (total, good)
+        assert summaries[week_start]['expenses'] == pytest.approx(loop_expenses(week_start, week_end))
+
+
+def test_weekly_summary_is_stable_when_cached(seeded_app):
+    first = weekly_summary(12)
+    assert weekly_summary(12) == first
+
+
+@pytest.mark.parametrize('weeks_ago', [0, 5, 70])
+def test_weekly_performance_matches_per_employee_loop(seeded_app, weeks_ago):
+    week_start = week_start_for(date.today()) - timedelta(weeks=weeks_ago)
+    week_end = week_start + timedelta(days=6)
+
+    performance = Employee.weekly_performance(week_start)
+    active = Employee.query.filter_by(is_active=True).order_by(Employee.id).all()
+    assert [row['employee'].id for row in performance] == [employee.id for employee in active]
+
+    for row in performance:
+        total, good = loop_accounts(week_start, week_end, row['employee'].id)
+        assert (row['total_accounts'], row['good_accounts']) == (total, good)
+        assert row['payment'] == total * 500
+
+
+def test_weekly_performance_pages_cover_the_ranking(seeded_app):
+    ranked = Employee.weekly_performance(sort='total_accounts', descending=True)
+    pages = [row for page in (1, 2, 3)
+             for row in Employee.weekly_performance(sort='total_accounts', descending=True,
+                                                    page=page, per_page=6)]
+    assert [row['employee'].id for row in pages] == [row['employee'].id for row in ranked]
+
+
+@pytest.mark.parametrize('granularity', ['week', 'month'])
+def test_timeseries_matches_per_period_loop(seeded_app, granularity):
+    # Start mid-period so the first bucket is partial
+    end = date.today()
+    start = end - timedelta(days=500)
+    data = timeseries(start, end, granularity)
+
+    periods = period_starts(start, end, granularity)
+    assert data['buckets'] == [period.isoformat() for period in periods]
+
+    series = data['series']
+    for i, period in enumerate(periods):
+        first = max(period, start)
+        last = min(_next_period(period, granularity) - timedelta(days=1), end)
+        total, good = loop_accounts(first, last)
+        expenses = loop_expenses(first, last)
+
+        assert (series['accounts'][i], series['good_accounts'][i]) == (total, good)
+        assert series['expenses'][i] == pytest.approx(expenses, abs=0.01)
+        assert series['profit'][i] == pytest.approx(good * 1400 - total * 500 - expenses, abs=0.01)
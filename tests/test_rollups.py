@@ -0,0 +1,31 @@
+"""WeeklyReport rollup writes."""
+from datetime import date, timedelta
+from sqlalchemy import event
+from app import db
+from models import Expense, WeeklyReport
+from reporting import refresh_weekly_reports, week_start_for
+
+
+def test_refresh_updates_a_rollup_another_writer_created(app):
+    week_start = week_start_for(date.today())
+    db.session.add(Expense(description='Fuel', amount=250, category='Travel', date_incurred=date.today()))
+    db.session.commit()
+
+    # Another writer commits this week's rollup just before ours is written
+    raced = []
+
+    def other_writer_first(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT INTO weekly_report') and not raced:
+            raced.append(True)
+            with db.engine.begin() as connection:
+                connection.execute(WeeklyReport.__table__.insert(), {
+                    'week_start': week_start, 'week_end': week_start + timedelta(days=6), 'total_expenses': 0})
+    event.listen(db.engine, 'before_cursor_execute', other_writer_first)
+    try:
+        refresh_weekly_reports([date.today()])
+        db.session.commit()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', other_writer_first)
+
+    assert raced
+    assert [(report.week_start, report.total_expenses) for report in WeeklyReport.query] == [(week_start, 250)]